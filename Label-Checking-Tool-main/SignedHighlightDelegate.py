@@ -18,6 +18,7 @@ from drop_down import CustomMultiSelectComboBox
 from key_value_selector import AtomicKeyValueSelector
 from PyQt5.QtWidgets import QLabel, QStyledItemDelegate
 from PyQt5.QtGui import QTextDocument
+from label_store import get_store
 
 
 
@@ -26,39 +27,33 @@ class SignedHighlightDelegate(QStyledItemDelegate):
         super().__init__(parent)
         self.valid_color = "#a8e6cf"  # Light green for fully signed
 
-        # ✅ Load data once and keep it cached
-        self.output_df = pd.read_csv("output_cm.csv")
+        # ✅ Shared label store, kept current by the edit handlers
+        self.store = get_store()
         self.img_names_df = pd.read_csv("img_names.csv")
 
+    @property
+    def output_df(self):
+        return self.store.df
+
     def is_fully_signed(self, base_image_name):
         """Check if ALL patches for this base image have Signed=1"""
-        base_name_lower = base_image_name.lower()
-        patch_images = [
-            img for img in self.output_df["Image Name"]
-            if img.lower().startswith(base_name_lower)
-        ]
-        
-        if not patch_images:
-            return False
-            
-        signed_status = self.output_df[
-            self.output_df["Image Name"].isin(patch_images)
-        ]["Signed"]
-        
-        return all(signed_status == 1)
+        # Precomputed per-base counts, updated by the store when patches are signed
+        return self.store.sign_off_aggregates().is_fully_signed(base_image_name)
 
     
     def paint(self, painter, option, index):
         text = index.data(Qt.DisplayRole)
         
         # Determine if this base image is fully signed
-        is_signed = self.is_fully_signed(text)
+        signed, total = self.store.sign_off_aggregates().progress(text)
+        is_signed = total > 0 and signed == total
+        progress = f' <span style="color:gray">({signed}/{total})</span>' if total else ""
         
         # Only apply styling if fully signed
         if is_signed:
-            html = f'<span style="background-color:{self.valid_color}">{text}</span>'
+            html = f'<span style="background-color:{self.valid_color}">{text}</span>{progress}'
         else:
-            html = text  # No styling for unsigned images
+            html = f'{text}{progress}'  # No styling for unsigned images
         
         # Render the HTML or plain text
         doc = QTextDocument()
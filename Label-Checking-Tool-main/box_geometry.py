@@ -0,0 +1,146 @@
+from PIL import Image
+
+
+# Pixel coordinates: x to the right, y down, boxes are (xtl, ytl, xbr, ybr).
+# Each of the eight right-angle orientations is a 2x2 matrix on (x, y) plus
+# the offset that puts the image back at the origin.
+IDENTITY = ((1, 0), (0, 1))
+
+TRANSPOSE_MATRICES = {
+    Image.Transpose.FLIP_LEFT_RIGHT: ((-1, 0), (0, 1)),
+    Image.Transpose.FLIP_TOP_BOTTOM: ((1, 0), (0, -1)),
+    Image.Transpose.ROTATE_90: ((0, 1), (-1, 0)),  # PIL: counter-clockwise
+    Image.Transpose.ROTATE_180: ((-1, 0), (0, -1)),
+    Image.Transpose.ROTATE_270: ((0, -1), (1, 0)),
+    Image.Transpose.TRANSPOSE: ((0, 1), (1, 0)),
+    Image.Transpose.TRANSVERSE: ((0, -1), (-1, 0)),
+}
+
+# EXIF orientation tag -> transpose that makes the stored image upright (as ImageOps.exif_transpose)
+EXIF_TRANSPOSES = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+def _multiply(a, b):
+    return tuple(tuple(sum(a[i][k] * b[k][j] for k in range(2)) for j in range(2)) for i in range(2))
+
+
+class Orientation:
+    """A right-angle rotation and/or flip, for mapping boxes instead of re-rotating images.
+
+    Orientations compose, so "undo the EXIF orientation, then the manual
+    rotation" is one transform: images need a single transpose() (or none,
+    when only a crop has to be turned) and boxes move between the stored and
+    the displayed frame analytically.
+    """
+
+    def __init__(self, matrix=IDENTITY):
+        self.matrix = matrix
+
+    @classmethod
+    def from_transpose(cls, method):
+        return cls(TRANSPOSE_MATRICES[method])
+
+    @classmethod
+    def from_exif(cls, orientation):
+        """Stored -> upright for an EXIF orientation tag (1 or unknown is the identity)"""
+        method = EXIF_TRANSPOSES.get(orientation)
+        return cls.from_transpose(method) if method is not None else cls()
+
+    @classmethod
+    def from_rotation(cls, degrees):
+        """Clockwise rotation, as img.rotate(-degrees, expand=True); multiples of 90 only"""
+        if degrees % 90:
+            raise ValueError(f"Not a right-angle rotation: {degrees}")
+        result = cls()
+        for _ in range(int(degrees % 360) // 90):
+            result = result.then(cls.from_transpose(Image.Transpose.ROTATE_270))
+        return result
+
+    def then(self, other):
+        """This orientation followed by `other`"""
+        return Orientation(_multiply(other.matrix, self.matrix))
+
+    def inverse(self):
+        # Rotations and flips are orthogonal: the inverse is the transpose
+        (a, b), (c, d) = self.matrix
+        return Orientation(((a, c), (b, d)))
+
+    @property
+    def is_identity(self):
+        return self.matrix == IDENTITY
+
+    def output_size(self, size):
+        """(width, height) after the transform"""
+        width, height = size
+        return (height, width) if self.matrix[0][0] == 0 else (width, height)
+
+    def _offset(self, size):
+        width, height = size
+        (a, b), (c, d) = self.matrix
+        corners = [(0, 0), (width, 0), (0, height), (width, height)]
+        return (-min(a * x + b * y for x, y in corners), -min(c * x + d * y for x, y in corners))
+
+    def map_point(self, point, size):
+        """Point in an image of `size` -> the same point in the transformed image"""
+        (a, b), (c, d) = self.matrix
+        x, y = point
+        dx, dy = self._offset(size)
+        return a * x + b * y + dx, c * x + d * y + dy
+
+    def map_box(self, box, size):
+        """Box in an image of `size` -> the box covering the same pixels after the transform"""
+        x0, y0 = self.map_point(box[:2], size)
+        x1, y1 = self.map_point(box[2:], size)
+        return min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
+
+    def transpose_method(self):
+        """The single PIL transpose doing this transform, or None for the identity"""
+        for method, matrix in TRANSPOSE_MATRICES.items():
+            if matrix == self.matrix:
+                return method
+        return None
+
+    def apply(self, img):
+        """The transformed image (a copy, also for the identity)"""
+        method = self.transpose_method()
+        return img.transpose(method) if method is not None else img.copy()
+
+    def crop(self, img, box):
+        """crop(box) of the transformed image, cutting from `img` and turning only the crop.
+
+        `box` is in the transformed frame; integer boxes give exactly the same
+        pixels as transforming the whole image first.
+        """
+        box = tuple(int(round(v)) for v in box)  # what Image.crop() does with floats
+        stored_box = self.inverse().map_box(box, self.output_size(img.size))
+        return self.apply(img.crop(stored_box))
+
+
+def exif_orientation(img):
+    return img.getexif().get(EXIF_ORIENTATION_TAG, 1)
+
+
+def image_orientation(img, rotation=0):
+    """Stored -> displayed for an open image: its EXIF orientation, then a manual
+    clockwise `rotation`. None if the rotation is not a right angle."""
+    if rotation % 90:
+        return None
+    return Orientation.from_exif(exif_orientation(img)).then(Orientation.from_rotation(rotation))
+
+
+def rotate_box(box, degrees, size):
+    """Box in an image of `size` -> the same pixels once the image is rotated clockwise by `degrees`"""
+    return Orientation.from_rotation(degrees).map_box(box, size)
+
+
+def scale_box(box, factor):
+    return tuple(v * factor for v in box)
@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from PIL import Image, ImageOps, ImageDraw
+from label_store import LABEL_CSV
+from name_index import base_name_of
+from box_geometry import image_orientation
+
+
+IMG_FOLDER = "imgs"
+ROTATIONS = (0, 90, 180, 270)
+PROGRESS_EVERY = 1.0  # seconds between progress lines
+BOX_COLUMNS = ["Image Name", "xtl", "ytl", "xbr", "ybr"]
+
+
+def index_patches(df):
+    """base image name -> (boxes, label texts) for every patch, built in one pass"""
+    # Everything after the coordinates, Signed included, as the overlays always showed
+    label_columns = [col for col in df.columns if col not in BOX_COLUMNS]
+    labels = df[label_columns].to_numpy() == 1
+    boxes = df[BOX_COLUMNS[1:]].to_numpy(dtype=float)
+    index = {}
+    for row, img_name in enumerate(df["Image Name"].to_numpy()):
+        active = sorted(label_columns[i] for i in labels[row].nonzero()[0])
+        entry = index.setdefault(base_name_of(img_name), ([], []))
+        entry[0].append(tuple(boxes[row]))
+        entry[1].append('-'.join(active) if active else "unlabeled")
+    return index
+
+
+def output_path_for(base_name, rotation, out_root="."):
+    return os.path.join(out_root, f"boxed_images_{base_name}", f"boxed_{base_name}_{rotation}.jpg")
+
+
+def draw_boxes(img, boxes, texts):
+    """Red 3px boxes with their labels above (or inside, near the top edge)"""
+    draw = ImageDraw.Draw(img)
+    for (xtl, ytl, xbr, ybr), text in zip(boxes, texts):
+        draw.rectangle([(xtl, ytl), (xbr, ybr)], outline="red", width=3)
+        text_position = (xtl, ytl - 15) if ytl > 15 else (xtl, ytl + 5)
+        draw.text(text_position, text, fill="red")
+    return img
+
+
+def render_rotation(task):
+    """Worker: one base image at one rotation with every box drawn, written straight to disk"""
+    base_name, image_path, rotation, boxes, texts, out_path = task
+    with Image.open(image_path) as img:
+        # EXIF orientation and the QA rotation as a single transpose
+        orientation = image_orientation(img, rotation)
+        if orientation is not None:
+            img = orientation.apply(img)
+        else:
+            img = ImageOps.exif_transpose(img).rotate(-rotation, expand=True)
+    draw_boxes(img, boxes, texts).save(out_path)
+    return base_name, rotation, out_path
+
+
+def render_overlays(base_names, df=None, csv_path=LABEL_CSV, img_folder=IMG_FOLDER, out_root=".",
+                    rotations=ROTATIONS, workers=None):
+    """QA overlays for many base images: every (image, rotation) pair is a task on a process pool.
+
+    Patches are indexed by base image once, so looking up an image's boxes is
+    a dict get instead of a scan of the whole table. Returns a stats dict.
+    """
+    if df is None:
+        df = pd.read_csv(csv_path)
+    index = index_patches(df)
+    stats = {"images": 0, "overlays": 0, "missing": 0, "errors": 0, "seconds": 0.0}
+    tasks = []
+    for base_name in dict.fromkeys(base_names):
+        if base_name not in index:
+            print(f"No patches found for base image: {base_name}")
+            stats["missing"] += 1
+            continue
+        image_path = os.path.join(img_folder, f"{base_name}.jpg")
+        if not os.path.exists(image_path):
+            logging.error(f"Base image not found: {image_path}")
+            print(f"Error: Base image not found at {image_path}")
+            stats["missing"] += 1
+            continue
+        os.makedirs(os.path.dirname(output_path_for(base_name, 0, out_root)), exist_ok=True)
+        boxes, texts = index[base_name]
+        stats["images"] += 1
+        for rotation in rotations:
+            tasks.append((base_name, image_path, rotation, boxes, texts,
+                          output_path_for(base_name, rotation, out_root)))
+
+    start = last_report = time.time()
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(render_rotation, task): task for task in tasks}
+            for future in as_completed(futures):
+                base_name, rotation = futures[future][:2]
+                try:
+                    future.result()
+                    stats["overlays"] += 1
+                except Exception as e:
+                    logging.error(f"Error processing {base_name} ({rotation}): {str(e)}")
+                    print(f"Error processing {base_name} ({rotation}): {str(e)}")
+                    stats["errors"] += 1
+                now = time.time()
+                done = stats["overlays"] + stats["errors"]
+                if now - last_report >= PROGRESS_EVERY or done == len(tasks):
+                    last_report = now
+                    print(f"[{done}/{len(tasks)} overlays] {done / max(now - start, 1e-6):.1f} overlays/s, "
+                          f"{stats['errors']} errors")
+    stats["seconds"] = time.time() - start
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Draw the labelled boxes on base images at every rotation.")
+    parser.add_argument("names", nargs="*", help="base image names (without extension)")
+    parser.add_argument("-f", "--file", default=None,
+                        help="CSV with an 'Image Name' column of base images (e.g. rotated_img_names.csv)")
+    parser.add_argument("--csv", default=LABEL_CSV, help="labels CSV (default: %(default)s)")
+    parser.add_argument("--imgs", default=IMG_FOLDER, help="base image folder (default: %(default)s)")
+    parser.add_argument("-o", "--out", default=".", help="folder for the boxed_images_* folders")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    names = list(args.names)
+    if args.file:
+        names.extend(pd.read_csv(args.file)["Image Name"].astype(str).tolist())
+    if not names:
+        parser.error("no base images given")
+    stats = render_overlays(names, csv_path=args.csv, img_folder=args.imgs, out_root=args.out,
+                            workers=args.workers)
+    print(f"Rendered {stats['overlays']} overlays for {stats['images']} images in {stats['seconds']:.1f}s "
+          f"({stats['missing']} missing, {stats['errors']} errors)")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(filename='draw_boxes_single_image.log', level=logging.WARNING)
+    sys.exit(main())
@@ -2,6 +2,7 @@ import sys
 import random
 import colorsys
 import pandas as pd
+from label_store import get_store
 from functools import partial
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QScrollArea, QVBoxLayout, QGridLayout, QPushButton, QLabel, QHBoxLayout
@@ -31,16 +32,14 @@ class ChangeFrame(QWidget):
         self.label_to_short = dict(zip(self.buttons_df["xml_labels"], self.buttons_df["short_forms"]))
         
         # Get current labels for image
-        labels_df = pd.read_csv("output_cm.csv")
-        img_row = labels_df[labels_df["Image Name"] == img_name]
-        if img_row.empty:
+        store = get_store()
+        if img_name not in store:
             raise ValueError(f"No data found for image: {img_name}")
         
-        img_row = img_row.iloc[0]
         self.current_btn_list = [
             self.label_to_short[label] 
-            for label, value in img_row.items() 
-            if label != "Image Name" and value == 1 and label in self.label_to_short
+            for label in store.active_labels(img_name) 
+            if label in self.label_to_short
         ]
 
         # Setup UI
@@ -1,19 +1,10 @@
-import pandas as pd
+from label_stats import compute
 
-# Load the CSV file
-df = pd.read_csv("updated_file_1.csv")
+# One streaming pass over the CSV (see label_stats.py for the richer reports:
+# signed/unsigned, co-occurrence and per base image/camera/date breakdowns)
+stats = compute("updated_file_1.csv")
 
-# Keep only the label columns (assuming first 5 columns are not labels)
-label_df = df.iloc[:, 5:]
-
-# Sum each label column
-label_counts = label_df.sum()
-
-# Convert to a DataFrame so we can save to CSV
-label_counts_df = label_counts.reset_index()
-label_counts_df.columns = ['Label', 'Count']
-
-# Save to CSV
-label_counts_df.to_csv("label_counts.csv", index=False)
+# Label,Count for every label column, plus the number of signed rows
+stats.label_counts().to_csv("label_counts.csv", index=False)
 
 print("Label counts saved to 'label_counts.csv'")
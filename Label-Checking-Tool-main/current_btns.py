@@ -1,6 +1,7 @@
 import os
 import sys
 import pandas as pd
+from label_store import get_store
 from functools import partial
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QScrollArea, QVBoxLayout, QGridLayout, QPushButton, QLabel
@@ -34,20 +35,14 @@ class ActiveLabels(QWidget):
         self.label_to_short = dict(zip(self.buttons_df["xml_labels"], self.buttons_df["short_forms"]))
 
         # Load image-specific label info
-        labels_df = pd.read_csv("output_cm.csv")
-        img_row = labels_df[labels_df["Image Name"] == img_name]
-
-        if img_row.empty:
+        store = get_store()
+        if img_name not in store:
             raise ValueError(f"No data found for image: {img_name}")
 
-        img_row = img_row.iloc[0]
-
         # Get only the short forms of labels which have value == 1
         self.btn_list = []
-        for label, value in img_row.items():
-            if label == "Image Name":
-                continue
-            if value == 1 and label in self.label_to_short:
+        for label in store.active_labels(img_name):
+            if label in self.label_to_short:
                 self.btn_list.append(self.label_to_short[label])
 
         self.selected_buttons = []
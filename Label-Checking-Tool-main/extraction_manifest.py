@@ -0,0 +1,141 @@
+import os
+import json
+import hashlib
+
+
+MANIFEST_NAME = "manifest.jsonl"
+HASH_CHUNK = 1024 * 1024
+
+
+def file_signature(path):
+    """(mtime_ns, size) - cheap check before hashing a file"""
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def bytes_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+class ExtractionManifest:
+    """Append-only record of what patch extraction produced, kept in the output folder.
+
+    Two kinds of JSON lines, the last one for a path wins:
+      {"type": "source", "source", "sig", "hash"}
+          a base image's (mtime_ns, size) and content hash, so an unchanged
+          file is not re-hashed on the next run
+      {"type": "output", "output", "source_hash", "rotation", "box", "encoding", "hash"}
+          a file written from a base image (a patch, or the base copy with
+          "box": null), the PatchWriter settings used and the hash of the
+          bytes written
+
+    An output is up to date when its file exists and its source hash,
+    rotation, box and encoding match; everything else is redone. Lines are
+    flushed per base image, so an interrupted run resumes from the last one
+    done.
+    """
+
+    def __init__(self, out_dir, fsync=False):
+        self.path = os.path.join(out_dir, MANIFEST_NAME)
+        self.fsync = fsync
+        self.sources = {}
+        self.outputs = {}
+        lines = self._load()
+        # Superseded lines pile up across runs; rewrite once they dominate
+        if lines > 2 * (len(self.sources) + len(self.outputs)) + 1000:
+            self.compact()
+        self._file = open(self.path, "a", encoding="utf-8")
+        if not self._ends_with_newline():
+            self._file.write("\n")  # don't glue new records onto a torn line
+
+    def _ends_with_newline(self):
+        if os.path.getsize(self.path) == 0:
+            return True
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return 0
+        lines = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A crash mid-append can leave a partial last line
+                    print(f"Skipping corrupt manifest line in {self.path}")
+                    continue
+                lines += 1
+                self._apply(record)
+        return lines
+
+    def _apply(self, record):
+        if record.get("type") == "source":
+            self.sources[record["source"]] = record
+        elif record.get("type") == "output":
+            self.outputs[record["output"]] = record
+
+    def source(self, source_path):
+        return self.sources.get(source_path)
+
+    def is_fresh(self, output_path, source_hash, rotation, box, encoding=None):
+        """True if `output_path` was written from this source, rotation, box and encoding"""
+        record = self.outputs.get(output_path)
+        if record is None or source_hash is None:
+            return False
+        if record["source_hash"] != source_hash or record["rotation"] != rotation:
+            return False
+        if record.get("encoding") != encoding:
+            return False
+        if (record["box"] is None) != (box is None):
+            return False
+        if box is not None and [float(v) for v in record["box"]] != [float(v) for v in box]:
+            return False
+        return os.path.exists(output_path)
+
+    def record(self, records):
+        """Append a batch of records and flush them"""
+        if not records:
+            return
+        self._file.write("".join(json.dumps(record) + "\n" for record in records))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        for record in records:
+            self._apply(record)
+
+    def compact(self):
+        """Rewrite the manifest with only the current record for every path"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in list(self.sources.values()) + list(self.outputs.values()):
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        self._file.close()
+
+
+def source_record(source_path, sig, digest):
+    return {"type": "source", "source": source_path, "sig": sig, "hash": digest}
+
+
+def output_record(output_path, source_hash, rotation, box, digest, encoding=None):
+    return {"type": "output", "output": output_path, "source_hash": source_hash,
+            "rotation": rotation, "box": None if box is None else [float(v) for v in box],
+            "encoding": encoding, "hash": digest}
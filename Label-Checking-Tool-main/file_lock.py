@@ -0,0 +1,76 @@
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class LockHeldError(RuntimeError):
+    """Another process holds the lock"""
+
+
+class FileLock:
+    """Advisory lock on a lock file, shared between processes.
+
+    flock() on POSIX, a one-byte msvcrt lock on Windows (where a shared lock
+    is exclusive too). The OS drops the lock when the holder exits, so a
+    crashed process never leaves a stale lock behind.
+    """
+
+    POLL_SECONDS = 0.1
+
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def acquire(self, timeout=None):
+        """Take the lock; timeout=0 fails at once, None waits forever. Raises LockHeldError."""
+        if self._fd is not None:
+            return self
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                self._lock(fd)
+                break
+            except OSError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    os.close(fd)
+                    raise LockHeldError(f"{self.path} is locked by another process")
+                time.sleep(self.POLL_SECONDS)
+        self._fd = fd
+        return self
+
+    def _lock(self, fd):
+        if fcntl is not None:
+            fcntl.flock(fd, (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
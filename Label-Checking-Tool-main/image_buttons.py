@@ -1,283 +1,311 @@
 import os
-from functools import partial
-from PIL import Image
+from collections import OrderedDict
 from PyQt5.QtWidgets import (
-    QApplication, QWidget, QScrollArea, QVBoxLayout, QGridLayout,
-    QPushButton, QMessageBox, QLineEdit
+    QApplication, QWidget, QVBoxLayout, QListView, QStyledItemDelegate
 )
-from PyQt5.QtGui import QPixmap, QIcon, QFont, QPainter
-from PyQt5.QtCore import Qt, QSize, pyqtSignal, pyqtSlot, QObject, QThread 
-import pandas as pd
+from PyQt5.QtGui import QPixmap, QImage, QFont, QColor, QPen
+from PyQt5.QtCore import (
+    Qt, QSize, QRect, pyqtSignal, QObject, QThread, QThreadPool, QRunnable,
+    QAbstractListModel, QModelIndex, QVariant
+)
+from label_store import get_store
+from thumbnail_cache import get_thumbnail_cache
 
 
 IMAGE_FOLDER = "image_patches_20250426"
 BUTTON_SIZE = QSize(150, 150)
 PADDING = 10  # Space between buttons
+MAX_CACHED_PIXMAPS = 1000  # decoded thumbnails kept in memory (~90 MB)
+
+ImageNameRole = Qt.UserRole + 1
+
+
+class ThumbnailSignals(QObject):
+    # generation, row, image name, thumbnail
+    thumbnail_ready = pyqtSignal(int, int, str, QImage)
+    # generation, row, decoded, failed (neither when skipped)
+    task_done = pyqtSignal(int, int, bool, bool)
 
 
-class Worker(QObject):
-    progressChanged = pyqtSignal(str, QPixmap, int, int)
-    finished = pyqtSignal()
+class ThumbnailTask(QRunnable):
+    """Decode one grid thumbnail on a QThreadPool thread.
 
-    def __init__(self, image_list, image_folder):
+    Only QImage is touched off the GUI thread; the model turns it into a
+    QPixmap when the result arrives. Tasks for an older image list (stale
+    generation) or for rows scrolled out of view return without decoding.
+    """
+
+    def __init__(self, model, generation, row, img_file, image_folder):
         super().__init__()
-        self.image_list = image_list
+        self.model = model
+        self.generation = generation
+        self.row = row
+        self.img_file = img_file
         self.folder = image_folder
+        self.signals = model.thumbnail_signals
+        self.cache = get_thumbnail_cache()
 
-    @pyqtSlot()
-    def do_work(self):
-        for img_file in self.image_list:
-            img_path = os.path.join(self.folder, img_file)
-            try:
-                # Check if image is signed off
-                is_signed = self.is_image_signed(img_file)
-                
-                with Image.open(img_path) as img:
-                    width, height = img.size
-                    aspect_ratio = width / height
-                    
-                    # Calculate dimensions with space for borders
-                    max_content_width = BUTTON_SIZE.width() - 6
-                    max_content_height = BUTTON_SIZE.height() - 6
-                    
-                    if width > height:
-                        content_width = max_content_width
-                        content_height = int(content_width / aspect_ratio)
-                        if content_height > max_content_height:
-                            content_height = max_content_height
-                            content_width = int(content_height * aspect_ratio)
-                    else:
-                        content_height = max_content_height
-                        content_width = int(content_height * aspect_ratio)
-                        if content_width > max_content_width:
-                            content_width = max_content_width
-                            content_height = int(content_width / aspect_ratio)
-                
-                # Create base pixmap
-                pixmap = QPixmap(img_path).scaled(
-                    content_width, 
-                    content_height,
-                    Qt.KeepAspectRatio,
-                    Qt.SmoothTransformation
-                )
-                
-                # Create star overlay if signed
-                if is_signed:
-                    # Create a larger pixmap to hold both image and star
-                    composite = QPixmap(BUTTON_SIZE)
-                    composite.fill(Qt.transparent)
-                    
-                    painter = QPainter(composite)
-                    # Draw the image centered
-                    painter.drawPixmap(
-                        (BUTTON_SIZE.width() - content_width) // 2,
-                        (BUTTON_SIZE.height() - content_height) // 2,
-                        pixmap
-                    )
-                    
-                    # Draw star in top-right corner
-                    star_size = 20
-                    painter.setPen(Qt.yellow)
-                    painter.setFont(QFont("Arial", star_size))
-                    painter.drawText(
-                        BUTTON_SIZE.width() - star_size - 5, 
-                        5 + star_size, 
-                        "★"
-                    )
-                    painter.end()
-                    
-                    final_pixmap = composite
-                else:
-                    final_pixmap = pixmap
-
-                self.progressChanged.emit(img_file, final_pixmap, content_width, content_height)
-            except Exception as e:
-                print(f"Error processing {img_path}: {e}")
-        self.finished.emit()
-
-    def is_image_signed(self, img_file):
-        """Check if image is signed off in your database"""
+    def run(self):
+        img_path = os.path.join(self.folder, self.img_file)
+        decoded = failed = False
         try:
-            df = pd.read_csv("output_cm.csv")
-            signed = df.loc[df["Image Name"] == img_file, "Signed"].values[0]
-            return bool(signed)
-        except:
-            return False
+            if self.generation != self.model.generation:
+                return  # user already moved on to another image list
+            first, last = self.model.visible_rows
+            if not first <= self.row <= last:
+                return  # scrolled past before we got to it
+
+            # Pre-scaled thumbnail from the on-disk cache (decoded only on a miss)
+            max_content_size = (BUTTON_SIZE.width() - 6, BUTTON_SIZE.height() - 6)
+            data, _, _ = self.cache.thumbnail(img_path, max_content_size)
+            image = QImage()
+            if not image.loadFromData(data):
+                raise IOError("thumbnail could not be decoded")
+
+            if self.generation == self.model.generation:
+                self.signals.thumbnail_ready.emit(self.generation, self.row, self.img_file, image)
+                decoded = True
+        except Exception as e:
+            print(f"Error processing {img_path}: {e}")
+            failed = True
+        finally:
+            self.signals.task_done.emit(self.generation, self.row, decoded, failed)
+
+
+class ThumbnailModel(QAbstractListModel):
+    """List model over ImageGrid.images; thumbnails are decoded only when a row is painted"""
+
+    def __init__(self, grid):
+        super().__init__(grid)
+        self.grid = grid
+        self.images = []
+        self.row_of = {}
+        self.pixmaps = OrderedDict()  # img_file -> QPixmap, least recently used first
+        self.requested = set()  # rows queued on the pool for this generation
+        self.failed = {}  # img_file -> generation whose decode failed (not retried in it)
+        self.visible_rows = (0, -1)  # read by pool threads
+
+        # Decoder pool: one thread per core, bumped generation cancels a list
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(max(1, QThread.idealThreadCount()))
+        self.generation = 0
+        self.request_counter = 0
+        self.thumbnail_signals = ThumbnailSignals()
+        self.thumbnail_signals.thumbnail_ready.connect(self.on_thumbnail_ready)
+        self.thumbnail_signals.task_done.connect(self.on_task_done)
+
+    def set_images(self, images):
+        self.cancel_pending()
+        self.beginResetModel()
+        self.failed = {}
+        self.images = list(images)
+        self.row_of = {img: row for row, img in enumerate(self.images)}
+        self.endResetModel()
+
+    def cancel_pending(self):
+        """Drop queued thumbnails; running ones finish but are ignored"""
+        self.generation += 1
+        self.pool.clear()
+        self.requested = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.images)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.images):
+            return QVariant()
+        img_file = self.images[index.row()]
+        if role == ImageNameRole:
+            return img_file
+        if role == Qt.DecorationRole:
+            pixmap = self.pixmaps.get(img_file)
+            if pixmap is None:
+                if self.failed.get(img_file) != self.generation:
+                    self.request(index.row())
+                return QVariant()
+            self.pixmaps.move_to_end(img_file)
+            return pixmap
+        if role == Qt.ToolTipRole:
+            return self.grid.tooltip_for(img_file)
+        if role == Qt.SizeHintRole:
+            return BUTTON_SIZE
+        return QVariant()
+
+    def request(self, row):
+        """Queue a decode; rows asked for first (top of the viewport) run first"""
+        if row in self.requested:
+            return
+        self.requested.add(row)
+        self.request_counter -= 1
+        task = ThumbnailTask(self, self.generation, row, self.images[row], IMAGE_FOLDER)
+        self.pool.start(task, self.request_counter)
+
+    def on_thumbnail_ready(self, generation, row, img_file, image):
+        if generation != self.generation:
+            return
+        self.pixmaps[img_file] = QPixmap.fromImage(image)
+        while len(self.pixmaps) > MAX_CACHED_PIXMAPS:
+            self.pixmaps.popitem(last=False)
+        self.refresh_rows([row])
+
+    def on_task_done(self, generation, row, decoded, failed):
+        if generation != self.generation:
+            return
+        if failed:
+            # Keep the placeholder instead of re-queueing on every repaint
+            self.failed[self.images[row]] = generation
+        elif not decoded:
+            # Skipped (scrolled away): allow the row to ask again when it is repainted
+            self.requested.discard(row)
+
+    @property
+    def pending(self):
+        return self.pool.activeThreadCount() > 0
+
+    def refresh_rows(self, rows):
+        for row in rows:
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+
+class ThumbnailDelegate(QStyledItemDelegate):
+    """Paints one grid cell: thumbnail, selection border and signed star"""
+
+    def __init__(self, grid):
+        super().__init__(grid)
+        self.grid = grid
+        self.star_font = QFont("Arial", 20)
+
+    def sizeHint(self, option, index):
+        return BUTTON_SIZE
+
+    def paint(self, painter, option, index):
+        img_file = index.data(ImageNameRole)
+        cell = QRect(option.rect.topLeft(), BUTTON_SIZE)
+        painter.save()
+
+        pixmap = index.data(Qt.DecorationRole)
+        if isinstance(pixmap, QPixmap) and not pixmap.isNull():
+            painter.drawPixmap(
+                cell.x() + (cell.width() - pixmap.width()) // 2,
+                cell.y() + (cell.height() - pixmap.height()) // 2,
+                pixmap
+            )
+        else:
+            # Placeholder until the decoder pool delivers the thumbnail
+            painter.fillRect(cell.adjusted(3, 3, -3, -3), QColor(40, 40, 40))
+
+        # Star in the top-right corner for signed patches
+        if self.grid.store.is_signed(img_file):
+            star_size = 20
+            painter.setPen(Qt.yellow)
+            painter.setFont(self.star_font)
+            painter.drawText(cell.right() - star_size - 5, cell.top() + 5 + star_size, "★")
+
+        border = self.grid.border_color(img_file)
+        if border is not None:
+            painter.setPen(QPen(QColor(border), 3))
+            painter.setBrush(Qt.NoBrush)
+            painter.drawRect(cell.adjusted(1, 1, -2, -2))
+        painter.restore()
 
 
 class ImageGrid(QWidget):
     image_selected = pyqtSignal(str)
-    
+
     def __init__(self, img_start):
         super().__init__()
         self.img_start = img_start
         self.images = sorted([f for f in os.listdir(IMAGE_FOLDER) if f.lower().endswith(('.png', '.jpg', '.jpeg'))])
-        
-        self.thread_running = False
+
         # Track selections
         self.primary_selection = None
         self.secondary_selection = set()
-        self._thread = None  # Use underscore to avoid naming conflict
-        
+
         self.layout = QVBoxLayout(self)
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.layout.addWidget(self.scroll_area)
+        self.model = ThumbnailModel(self)
 
-        self.container = QWidget()
-        self.grid_layout = QGridLayout(self.container)
-        self.grid_layout.setSpacing(PADDING)
-        self.scroll_area.setWidget(self.container)
+        # Only the cells in the viewport are painted (and therefore decoded)
+        self.view = QListView()
+        self.view.setViewMode(QListView.IconMode)
+        self.view.setResizeMode(QListView.Adjust)
+        self.view.setMovement(QListView.Static)
+        self.view.setUniformItemSizes(True)
+        self.view.setGridSize(QSize(BUTTON_SIZE.width() + PADDING, BUTTON_SIZE.height() + PADDING))
+        self.view.setSelectionMode(QListView.NoSelection)
+        self.view.setVerticalScrollMode(QListView.ScrollPerPixel)
+        self.view.setModel(self.model)
+        self.view.setItemDelegate(ThumbnailDelegate(self))
+        self.view.clicked.connect(self.on_left_click)
+        self.view.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.view.customContextMenuRequested.connect(self.on_right_click)
+        self.view.verticalScrollBar().valueChanged.connect(self.update_visible_rows)
+        self.layout.addWidget(self.view)
 
-        self.container.setStyleSheet("background-color: black;")
-        self.scroll_area.setStyleSheet("background-color: black;")
+        self.view.setStyleSheet("background-color: black;")
         self.setStyleSheet("background-color: black;")  # whole widget black
 
-        self.buttons = []
-        self.current_start = 0
-        self.current_end = 0
+        self.store = get_store()
+        self.store.subscribe(self.on_labels_changed)
         self.load_images()
 
-    def setup_worker(self, image_names):
-        # Clean up any existing thread
-        if self._thread is not None and self._thread.isRunning():
-            self._thread.quit()
-            self._thread.wait()
-        
-        self._thread = QThread()
-        self.worker = Worker(image_names, IMAGE_FOLDER)
-        self.worker.moveToThread(self._thread)
-
-        self._thread.started.connect(self.worker.do_work)
-        self.worker.progressChanged.connect(self.add_image_button)
-        self.worker.finished.connect(self._thread.quit)
-        self.worker.finished.connect(self.worker.deleteLater)
-        self._thread.finished.connect(self._thread.deleteLater)
-        self._thread.finished.connect(lambda: setattr(self, '_thread', None))
-        self.worker.finished.connect(lambda: setattr(self, 'thread_running', False))  # ✅ Add this
-
-        
-        self.thread_running = True
-        self._thread.start()
-
-    def load_images(self, img_file=None, direction="forward"):
-        """Load images with padding for backward navigation"""
-        try:
-            idx = self.images.index(img_file) if img_file is not None else 0
-        except ValueError:
-            idx = 0
-            
-        batch_size = 200
-        padding = 2  # Number of images to prepend from previous batch
-        
-        if direction == "forward":
-            start = max(0, idx - padding)
-            end = min(len(self.images), start + batch_size + padding)
-            if idx == 0:
-                start = 0
-                end = min(len(self.images), batch_size)
-        elif direction == "backward":
-            start = max(0, idx - batch_size - padding)
-            end = min(len(self.images), idx + padding)
-        else:
-            start = idx
-            end = min(len(self.images), start + batch_size)
-
-        # Update current batch range
-        self.current_start = start
-        self.current_end = end
-
-        # Clear previous buttons
-        for button in self.buttons:
-            button.deleteLater()
-        self.buttons = []
-        self.grid_layout.setColumnMinimumWidth(0, 0)  # Reset column minimums
-        
-        # Create new buttons
-        print(f"Loading images from {start} to {end} (total: {len(self.images)})")
-        self.setup_worker(self.images[start:end])
-
-    def add_image_button(self, img_file, final_pixmap, content_width, content_height):
-        """Add a new image button to the grid with proper labeling"""
-        button = QPushButton()
-        button.setIcon(QIcon(final_pixmap))
-        button.setIconSize(QSize(content_width, content_height))
-        button.setFixedSize(BUTTON_SIZE)
-        
-        # Store image name as a property
-        button.setProperty("img_file", img_file)
-        
-        # Get all active labels (columns with value 1)
+    @property
+    def thread_running(self):
+        """True while thumbnails are still being decoded"""
+        return self.model.pending
+
+    def load_images(self, img_file=None):
+        """Show every name in self.images, scrolled to img_file if given"""
+        print(f"Loading {len(self.images)} images")
+        self.model.set_images(self.images)
+        self.update_visible_rows()
+        row = self.model.row_of.get(img_file)
+        if row is not None:
+            self.view.scrollTo(self.model.index(row), QListView.PositionAtCenter)
+
+    def update_visible_rows(self, *args):
+        """Tell the decoder pool which rows are on screen (with one screen of slack)"""
+        # Cells sit on a uniform grid, so the range follows from the scroll offset
+        grid = self.view.gridSize()
+        viewport = self.view.viewport().rect()
+        columns = max(1, viewport.width() // grid.width())
+        top = self.view.verticalScrollBar().value()
+        first_row = (top // grid.height()) * columns
+        last_row = ((top + viewport.height()) // grid.height() + 1) * columns - 1
+        slack = max(1, last_row - first_row + 1)
+        self.model.visible_rows = (max(0, first_row - slack), last_row + slack)
+
+    def tooltip_for(self, img_file):
+        """Filename plus the active labels (columns with value 1)"""
         try:
-            output_df = pd.read_csv("output_cm.csv")
-            # Get the row for this image
-            img_row = output_df[output_df["Image Name"] == img_file].iloc[0]
-            # Find all columns (except metadata columns) with value 1
-            label_cols = [col for col in output_df.columns 
-                        if col not in ['Image Name', 'Signed', 'xtl', 'ytl', 'xbr', 'ybr']]
-            active_labels = [col for col in label_cols if img_row[col] == 1]
-            
-            # Set tooltip with filename and active labels
-            tooltip = f"{img_file}\nLabels: {', '.join(active_labels)}" if active_labels else img_file
-            button.setToolTip(tooltip)
+            active_labels = self.store.active_labels(img_file)
+            return f"{img_file}\nLabels: {', '.join(active_labels)}" if active_labels else img_file
         except Exception as e:
             print(f"Error loading labels for {img_file}: {str(e)}")
-            button.setToolTip(img_file)
-        
-        self.update_button_style(button)
-        button.clicked.connect(partial(self.on_left_click, img_file, button))
-        button.setContextMenuPolicy(Qt.CustomContextMenu)
-        button.customContextMenuRequested.connect(partial(self.on_right_click, img_file, button))
-        
-        self.buttons.append(button)
-        
-        # Grid positioning logic remains the same
-        index = len(self.buttons) - 1
-        area_width = self.scroll_area.viewport().width()
-        columns = max(1, (area_width + PADDING) // (BUTTON_SIZE.width() + PADDING))
-        row = index // columns
-        col = index % columns
-        
-        self.grid_layout.addWidget(button, row, col)
-
-    def on_left_click(self, img_file, button):
-        """Handle left-click selection, with backward/forward navigation"""
-        try:
-            current_index = self.images.index(img_file)
-            displayed_images = [b.property("img_file") for b in self.buttons]
-            padding = 2
+            return img_file
+
+    def on_labels_changed(self, img_names):
+        """Repaint cells (tooltip, star) whose labels were edited"""
+        rows = [self.model.row_of[img] for img in img_names if img in self.model.row_of]
+        self.model.refresh_rows(rows)
 
-            # Update center image FIRST
+    def on_left_click(self, index):
+        """Handle left-click selection"""
+        try:
+            img_file = index.data(ImageNameRole)
             old_center = self.img_start
             self.img_start = img_file
-
-            # Check if we need to load previous batch
-            if (current_index <= self.current_start + padding and 
-                self.current_start > 0):
-                if  self.thread_running:
-                    QMessageBox.warning(self, "Warning", "Image loading is still in progress")
-                    
-                    return
-        
-                self.load_images(img_file, direction="backward")
-            # Check if we need to load next batch
-            elif (current_index >= self.current_end - padding - 1 and 
-                  self.current_end < len(self.images)):
-                self.load_images(img_file, direction="forward")
-            else:
-                # Regular click - just update styles
-                if old_center in [b.property("img_file") for b in self.buttons]:
-                    old_button = next(b for b in self.buttons if b.property("img_file") == old_center)
-                    self.update_button_style(old_button)
-                self.update_button_style(button)
-
-            # Always emit after handling navigation
+            self.refresh([old_center, img_file])
             self.image_selected.emit(img_file)
         except Exception as e:
             print(f"Error handling click: {e}")
 
-    def on_right_click(self, img_file, button, pos):
+    def on_right_click(self, pos):
         """Handle right-click selection for label copying"""
+        index = self.view.indexAt(pos)
+        if not index.isValid():
+            return
+        img_file = index.data(ImageNameRole)
         if self.primary_selection is None:
             self.primary_selection = img_file
         else:
@@ -287,77 +315,32 @@ class ImageGrid(QWidget):
                 self.secondary_selection.remove(img_file)
             else:
                 self.secondary_selection.add(img_file)
-        
-        self.update_button_style(button)
 
-    def update_button_style(self, button):
-        """Update button style to show selection state without square background"""
-        img_file = button.property("img_file")
-        
+        self.refresh([img_file])
+
+    def border_color(self, img_file):
+        """Selection border for a cell, or None for just the image"""
         if img_file == self.primary_selection:
-            # Green border for primary selection (right-click)
-            button.setStyleSheet("""
-                QPushButton {
-                    border: 3px solid green;
-                    background: transparent;
-                    padding: 0px;
-                }
-            """)
-        elif img_file in self.secondary_selection:
-            # Red border for secondary selections (right-click)
-            button.setStyleSheet("""
-                QPushButton {
-                    border: 3px solid red;
-                    background: transparent;
-                    padding: 0px;
-                }
-            """)
-        elif img_file == self.img_start:
-            # Yellow border for currently selected image (left-click)
-            button.setStyleSheet("""
-                QPushButton {
-                    border: 3px solid yellow;
-                    background: transparent;
-                    padding: 0px;
-                }
-            """)
+            return "green"  # primary selection (right-click)
+        if img_file in self.secondary_selection:
+            return "red"  # secondary selections (right-click)
+        if img_file == self.img_start:
+            return "yellow"  # currently selected image (left-click)
+        return None
+
+    def refresh(self, img_names=None):
+        """Repaint the given cells, or the whole viewport"""
+        if img_names is None:
+            self.view.viewport().update()
         else:
-            # No border (just the image)
-            button.setStyleSheet("""
-                QPushButton {
-                    border: none;
-                    background: transparent;
-                    padding: 0px;
-                }
-            """)
+            self.on_labels_changed(img_names)
 
     def resizeEvent(self, event):
-        """Re-layout when window is resized"""
         super().resizeEvent(event)
-        self.relayout_buttons()
-
-    def relayout_buttons(self):
-        """Reorganize buttons when window size changes"""
-        if not self.buttons:
-            return
-            
-        # Clear the layout
-        for i in reversed(range(self.grid_layout.count())):
-            self.grid_layout.itemAt(i).widget().setParent(None)
-
-        area_width = self.scroll_area.viewport().width()
-        columns = max(1, (area_width + PADDING) // (BUTTON_SIZE.width() + PADDING))
-        
-        row, col = 0, 0
-        for button in self.buttons:
-            self.grid_layout.addWidget(button, row, col)
-            col += 1
-            if col >= columns:
-                col = 0
-                row += 1
+        self.update_visible_rows()
 
     def cleanup(self):
         """Clean up resources when closing"""
-        if self._thread is not None and self._thread.isRunning():
-            self._thread.quit()
-            self._thread.wait()
\ No newline at end of file
+        self.store.unsubscribe(self.on_labels_changed)
+        self.model.cancel_pending()
+        self.model.pool.waitForDone()
@@ -0,0 +1,274 @@
+import os
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from PIL import Image, ImageOps
+from PyQt5.QtGui import QImage
+from rotation_registry import get_rotation_registry
+from name_index import base_name_of
+from box_geometry import image_orientation
+
+
+PATCH_FOLDER = "image_patches_20250426"
+BASE_FOLDER = "imgs"
+BASE_EXTENSIONS = ['.jpg', '.JPG', '.jpeg', '.JPEG']
+PREFETCH_BYTES = 512 * 1024 * 1024  # ~12 decoded 12MP base images
+PATCHES_AHEAD = 4
+PATCHES_BEHIND = 1
+PREVIEW_SIZE = (1600, 1200)  # until the panel reports its real size
+DCT_SCALES = (1, 2, 4, 8)  # reductions libjpeg can decode at
+
+# PIL mode -> (raw mode to export, QImage format, bytes per pixel). RGB goes out
+# padded to 32 bits (X = 0xff), which drawImage() paints without a conversion pass.
+QT_FORMATS = {
+    "RGB": ("RGBX", QImage.Format_RGBX8888, 4),
+    "RGBA": ("RGBA", QImage.Format_RGBA8888, 4),
+    "L": ("L", QImage.Format_Grayscale8, 1),
+}
+
+
+def find_base_image(base_name, folder=BASE_FOLDER):
+    """Path of imgs/<base_name> with any JPEG extension, or None"""
+    for ext in BASE_EXTENSIONS:
+        path = os.path.join(folder, f"{base_name}{ext}")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def draft_to_fit(img, fit_size, rot_angle=0):
+    """Ask libjpeg for the smallest DCT scale (1/2, 1/4, 1/8) that still covers
+    `fit_size` once the image is upright. Returns the reduction factor."""
+    if img.format != "JPEG" or not fit_size:
+        return 1
+    width, height = img.size
+    if img.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+        width, height = height, width  # EXIF says it is stored sideways
+    if rot_angle % 180 == 90:
+        width, height = height, width
+    fit = max(width / fit_size[0], height / fit_size[1])
+    if fit < 2:
+        return 1
+    # draft() works on the stored (not upright) dimensions
+    stored_width, stored_height = img.size
+    img.draft("RGB", (math.ceil(stored_width / fit), math.ceil(stored_height / fit)))
+    if not img.size[0]:
+        return 1
+    # libjpeg rounds the scaled size up, so floor division can be off by one step
+    ratio = stored_width / img.size[0]
+    return min(DCT_SCALES, key=lambda scale: abs(scale - ratio))
+
+
+def load_base_image(img_path, fit_size=None):
+    """Decode a field image upright: EXIF orientation, then the manual rotation.
+
+    Both are folded into one transpose (see box_geometry), so the decoded
+    pixels are moved once. With `fit_size`, JPEGs are decoded reduced (see
+    draft_to_fit); the factor is recorded in img.info["draft_scale"] and the
+    true upright full-resolution size in img.info["full_size"], since the
+    reduced size times the factor can overshoot it by up to factor - 1 pixels.
+    """
+    rot_angle = get_rotation_registry().rotation_for(os.path.basename(img_path))
+    with Image.open(img_path) as img:
+        orientation = image_orientation(img, rot_angle)
+        full_size = None
+        if orientation is not None:
+            # Read before draft() shrinks img.size
+            full_size = orientation.output_size(img.size)
+        else:
+            # The size after an arbitrary-angle rotate() is only known once it is
+            # done, so those images are decoded at full resolution
+            fit_size = None
+        scale = draft_to_fit(img, fit_size, rot_angle)
+        if orientation is not None:
+            img = orientation.apply(img)
+        else:
+            img = ImageOps.exif_transpose(img)
+            img = img.rotate(-rot_angle, expand=True)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.info["draft_scale"] = scale
+    img.info["full_size"] = full_size or img.size
+    return img
+
+
+def pil_to_qimage(pil_img):
+    """QImage over a single tobytes() copy of the PIL pixels, for QPainter.drawImage().
+
+    PIL does not expose its own pixel memory, so that one copy is the only
+    one: the QImage points at `data` (attached to it so it lives as long as
+    the image) and is painted directly, never converted to a QPixmap. It must
+    not leave the process as is: .copy() it before handing it to the clipboard.
+    """
+    if pil_img.mode not in QT_FORMATS:
+        has_alpha = "A" in pil_img.getbands() or "transparency" in pil_img.info
+        pil_img = pil_img.convert("RGBA" if has_alpha else "RGB")
+    raw_mode, qt_format, channels = QT_FORMATS[pil_img.mode]
+    data = pil_img.tobytes("raw", raw_mode)
+    qimage = QImage(data, pil_img.width, pil_img.height, pil_img.width * channels, qt_format)
+    qimage.pil_buffer = data
+    return qimage
+
+
+def load_patch_image(img_path):
+    image = QImage(img_path)
+    if image.isNull():
+        raise IOError(f"Could not decode {img_path}")
+    return image
+
+
+def _size_of(image):
+    if isinstance(image, QImage):
+        return image.sizeInBytes()
+    return image.width * image.height * len(image.getbands())
+
+
+class ImagePrefetcher:
+    """Decodes the images a reviewer is about to look at on background threads.
+
+    Results (QImage patches, upright PIL base images) live in a byte-bounded
+    LRU keyed by path. Each entry is a Future, so asking for an image that is
+    still being prefetched waits for that decode instead of starting another.
+    """
+
+    def __init__(self, max_bytes=PREFETCH_BYTES, workers=2):
+        self.max_bytes = max_bytes
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self.entries = OrderedDict()  # (kind, path) -> Future
+        self.sizes = {}  # (kind, path) -> bytes, for finished entries
+        self.total_bytes = 0
+        self.preview_size = PREVIEW_SIZE
+        self.loaders = {
+            "patch": load_patch_image,
+            "base": load_base_image,
+            "preview": lambda path: load_base_image(path, self.preview_size),
+        }
+        self.lock = threading.RLock()  # Future.cancel() runs callbacks inline
+
+    def _submit(self, kind, path):
+        key = (kind, path)
+        with self.lock:
+            future = self.entries.get(key)
+            if future is not None:
+                self.entries.move_to_end(key)
+                return future
+            future = self.executor.submit(self.loaders[kind], path)
+            self.entries[key] = future
+        future.add_done_callback(lambda f, key=key: self._account(key, f))
+        return future
+
+    def _account(self, key, future):
+        if future.cancelled() or future.exception() is not None:
+            with self.lock:
+                if self.entries.get(key) is future:
+                    del self.entries[key]  # let the next request retry
+            return
+        with self.lock:
+            if self.entries.get(key) is not future:
+                return
+            self.sizes[key] = _size_of(future.result())
+            self.total_bytes += self.sizes[key]
+            # Evict least recently used finished entries
+            for old_key in list(self.entries):
+                if self.total_bytes <= self.max_bytes:
+                    break
+                if old_key == key or old_key not in self.sizes:
+                    continue
+                del self.entries[old_key]
+                self.total_bytes -= self.sizes.pop(old_key)
+
+    def patch(self, img_path):
+        """QImage of a patch for display, without waiting in the prefetch queue.
+
+        A finished or running prefetch is used (never decoded twice); one that
+        is still queued behind other decodes is cancelled and the patch is
+        decoded right here instead, as a direct load would.
+        """
+        key = ("patch", img_path)
+        with self.lock:
+            future = self.entries.get(key)
+            if future is not None and future.cancel():
+                future = None  # cancel() only succeeds while it is queued
+        if future is not None:
+            return future.result()
+        image = load_patch_image(img_path)
+        future = Future()
+        future.set_result(image)
+        with self.lock:
+            self.entries[key] = future
+        self._account(key, future)
+        return image
+
+    def base(self, img_path):
+        """Upright, full-resolution PIL image of a base (field) image"""
+        return self._submit("base", img_path).result()
+
+    def base_future(self, img_path):
+        """Start (or join) a full-resolution decode without waiting for it"""
+        return self._submit("base", img_path)
+
+    def preview(self, img_path):
+        """Upright base image decoded at the reduced scale that fits preview_size"""
+        return self._submit("preview", img_path).result()
+
+    def preview_future(self, img_path):
+        """Start (or join) a preview decode without waiting for it"""
+        return self._submit("preview", img_path)
+
+    def prefetch_around(self, names, index, direction=1, folder=PATCH_FOLDER):
+        """Queue the patches the reviewer is heading towards, plus the base image they come from.
+
+        `names` is the grid's image list and `index` the current position in it;
+        `direction` is +1 when moving forward and -1 when moving back. Index -1
+        means nothing is selected yet: the grid opens at the top, so the first
+        patches are queued whichever way the reviewer navigated to the list.
+        """
+        if not names:
+            return
+        direction = -1 if direction < 0 and index >= 0 else 1
+        wanted = []
+        for step in range(1, PATCHES_AHEAD + 1):
+            wanted.append(index + direction * step)
+        for step in range(1, PATCHES_BEHIND + 1):
+            wanted.append(index - direction * step)
+
+        wanted_keys = set()
+        for pos in wanted:
+            if 0 <= pos < len(names):
+                path = os.path.join(folder, names[pos])
+                wanted_keys.add(("patch", path))
+                self._submit("patch", path)
+
+        current = names[min(max(index, 0), len(names) - 1)]
+        self.prefetch_base(current)
+        wanted_keys.add(("preview", find_base_image(base_name_of(current))))
+        self.cancel_except(wanted_keys)
+
+    def prefetch_base(self, patch_name):
+        """Queue a screen-sized preview of the base image a patch was cut from"""
+        base_path = find_base_image(base_name_of(patch_name))
+        if base_path:
+            self._submit("preview", base_path)
+
+    def cancel_except(self, keep):
+        """Drop queued (not yet started) decodes the reviewer has moved away from"""
+        with self.lock:
+            queued = [(key, future) for key, future in self.entries.items()
+                      if key not in keep and not future.done()]
+            # cancel() fires _account, which removes the entry
+            for key, future in queued:
+                future.cancel()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_shared_prefetcher = None
+
+
+def get_prefetcher():
+    global _shared_prefetcher
+    if _shared_prefetcher is None:
+        _shared_prefetcher = ImagePrefetcher()
+    return _shared_prefetcher
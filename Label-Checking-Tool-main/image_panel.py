@@ -1,16 +1,20 @@
 import os
-from PIL import Image, ImageOps, ImageDraw
-from PIL import ImageQt
+from collections import OrderedDict
+from PIL import Image, ImageDraw
 from PyQt5.QtWidgets import (QApplication, QVBoxLayout, QHBoxLayout, 
                             QWidget, QPushButton, QLabel)
-from PyQt5.QtGui import QPixmap, QImage, QPainter, QColor
-from PyQt5.QtCore import Qt, QPoint
-import pandas as pd
+from PyQt5.QtGui import QPainter, QColor, QPen
+from PyQt5.QtCore import Qt, QPoint, QRectF, QTimer, pyqtSignal
+from label_store import get_store
+from image_pyramid import ImagePyramid
+from image_loading import load_base_image, find_base_image, get_prefetcher, pil_to_qimage
 from PyQt5.QtWidgets import QMenu, QApplication  # Add to existing imports
-from PyQt5.QtGui import QClipboard  # Add to existing imports
 
 
 
+SCALED_CACHE_SIZE = 8  # scaled renditions kept per panel (one per recent zoom level)
+SETTLE_MS = 150  # smooth re-render this long after the last pan/zoom event
+
 
 def extract_coordinates_from_filename(filename):
     """Extracts base_name, xtl, ytl, xbr, ybr from patch filename."""
@@ -26,13 +30,18 @@ def extract_coordinates_from_filename(filename):
     return None, None, None, None, None
 
 class ImagePanel(QLabel):
+    # (path, finished Future), emitted from the prefetch thread
+    full_image_ready = pyqtSignal(str, object)
+    preview_ready = pyqtSignal(str, object)
+
     def __init__(self):
         super().__init__()
-        self.pixmap = None
+        self.image = None
         self.setStyleSheet("background-color: black;")  # <<< add this line
 
-        self.patch_pixmap = None
-        self.base_pixmap = None
+        self.patch_image = None
+        self.base_pyramid = None  # tiled base image, drawn instead of self.image
+        self.pyramid = None
         self.zoom = 1.0
         self.offset = QPoint(0, 0)
         self.drag_start_pos = None
@@ -42,16 +51,32 @@ class ImagePanel(QLabel):
         self.setMinimumSize(400, 400)
         self.current_base_path = None
         self.image_info_label = QLabel("No image selected")
+        self.info_text_width = self.image_info_label.sizeHint().width()
         self.filename = None
 
         self.current_labels = []
-        self.output_df = pd.read_csv("output_cm.csv")  # Load your label data
+        self.store = get_store()  # Shared label data
+        self.store.subscribe(self.on_labels_changed)
+
+        # (image, zoom, device pixel ratio) -> smoothly downscaled QImage
+        self.scaled_cache = OrderedDict()
+        # Pan/zoom draws with a fast transform; smooth once the user stops
+        self.interacting = False
+        self.settle_timer = QTimer(self)
+        self.settle_timer.setSingleShot(True)
+        self.settle_timer.setInterval(SETTLE_MS)
+        self.settle_timer.timeout.connect(self.end_interaction)
+
+        # Base images open as a reduced JPEG decode; full resolution on zoom-in
+        self.full_requested = None
+        self.full_image_ready.connect(self.on_full_image_ready)
+        self.preview_ready.connect(self.on_preview_ready)
         self.setContextMenuPolicy(Qt.CustomContextMenu)
         self.customContextMenuRequested.connect(self.show_context_menu)
 
     def show_context_menu(self, pos):
         """Show context menu on right-click"""
-        if not self.pixmap:
+        if self.image is None and not self.pyramid:
             return
             
         menu = QMenu(self)
@@ -61,9 +86,21 @@ class ImagePanel(QLabel):
 
     def copy_image_to_clipboard(self):
         """Copy current image to clipboard"""
-        if self.pixmap:
-            clipboard = QApplication.clipboard()
-            clipboard.setPixmap(self.pixmap)
+        clipboard = QApplication.clipboard()
+        if self.pyramid:
+            if self.pyramid.first_level > 0:
+                self.pyramid.set_full(get_prefetcher().base(self.current_base_path))
+            image = self.pyramid.to_qimage()
+            if self.bbox_coords:
+                painter = QPainter(image)
+                painter.setPen(QPen(Qt.red, 3))
+                xtl, ytl, xbr, ybr = self.bbox_coords
+                painter.drawRect(xtl, ytl, xbr - xtl, ybr - ytl)
+                painter.end()
+            clipboard.setImage(image)
+            print("Image copied to clipboard")
+        elif self.image is not None:
+            clipboard.setImage(self.image.copy())
             print("Image copied to clipboard")
 
 
@@ -71,24 +108,9 @@ class ImagePanel(QLabel):
     def process_image(self, img_path, draw_bbox=False):
         """Process image with EXIF correction and transformations"""
         try:
-            img = Image.open(img_path)
+            # EXIF orientation correction, then the manual rotation from the registry
+            img = load_base_image(img_path)
             print(f"[DEBUG] Opened image: {img_path}")
-            rot_df = pd.read_excel("strawberry_rotation.xlsx")
-            img_name = img_path[5:]
-            print(f"[DEBUG] Image name for rotation lookup: {img_name}")
-            rot_angle = rot_df.loc[rot_df['image_name'] == img_name, 'rotation']
-            
-            rot_angle = int(rot_angle)
-            print(f"[DEBUG] Rotation angle found: {rot_angle}")
-            # 1. Apply EXIF orientation correction
-            img = ImageOps.exif_transpose(img).convert("RGB")
-            print("[DEBUG] Applied EXIF transpose and converted to RGB.")
-
-            # 2. Apply manual rotation if needed
-            print("rot_angle", rot_angle)
-            if rot_angle:
-                img = img.rotate(-rot_angle, expand=True)
-                print(f"[DEBUG] Rotated image by {self.rotation_angle} degrees.")
 
             # 3. Draw bounding box if requested and coordinates are available
             if draw_bbox and self.bbox_coords:
@@ -122,19 +144,10 @@ class ImagePanel(QLabel):
 
     def get_labels_for_image(self, image_name):
         print("get labels ")
-        """Get the labels for a specific image from the CSV"""
+        """Get the labels for a specific image from the label store"""
         try:
-            # Find the row for this image
-            self.output_df = pd.read_csv("output_cm.csv")  # Reload in case it was modified
-            row = self.output_df[self.output_df["Image Name"] == image_name].iloc[0]
-            
-            # Get all labels that are marked as 1 (True)
-            labels = []
-            for col in self.output_df.columns:
-                if col not in ["Image Name", "Signed"] and row[col] == 1:
-                    labels.append(col)
-                    
-            return labels
+            # Store is kept up to date by the confirm/multi-change handlers
+            return self.store.active_labels(image_name)
         except Exception as e:
             print(f"Error getting labels: {str(e)}")
             return []
@@ -142,105 +155,66 @@ class ImagePanel(QLabel):
 
 
 
-    def set_image(self, pixmap=None, filename=None):
+    def set_image(self, image=None, filename=None):
         print("set_iamge ")
         """Load and process image"""
         if filename:
             print(f"Setting image with filename: {filename}")
 
             print(f"Setting image with filename: {filename}")
-            self.filename = filename
-            
-            # Extract base name to check if this is a patchdob
-            base_name, xtl, ytl, xbr, ybr = extract_coordinates_from_filename(filename)
-            
-            if None not in (xtl, ytl, xbr, ybr):
-                # This is a patch image - get its labels
-                self.current_labels = self.get_labels_for_image(filename)
-                info_text = f"{filename}\nLabels: {', '.join(self.current_labels)}"
-            else:
-                # This is a base image
-                self.current_labels = []
-                info_text = filename
-                
-
-            print("print 1")
-            self.image_info_label.setText(info_text)
-            print("print 2")
-
-
-
             self.filename = filename  # Store filename as attribute
             pil_img = self.process_image(filename)
             
-            # Convert PIL Image to QImage
-            if pil_img.mode == "RGB":
-                qimage = QImage(pil_img.tobytes(), pil_img.size[0], pil_img.size[1], 
-                            pil_img.size[0] * 3, QImage.Format_RGB888)
-            elif pil_img.mode == "RGBA":
-                qimage = QImage(pil_img.tobytes(), pil_img.size[0], pil_img.size[1], 
-                            pil_img.size[0] * 4, QImage.Format_RGBA8888)
-            else:
-                pil_img = pil_img.convert("RGB")
-                qimage = QImage(pil_img.tobytes(), pil_img.size[0], pil_img.size[1], 
-                            pil_img.size[0] * 3, QImage.Format_RGB888)
-                
-            self.patch_pixmap = QPixmap.fromImage(qimage)
+            self.patch_image = pil_to_qimage(pil_img)
         else:
-            self.patch_pixmap = pixmap
+            self.patch_image = image
             
-        self.pixmap = self.patch_pixmap
+        self.image = self.patch_image
+        self.pyramid = None
+        self.showing_base = False
+        self.update_info_text()
         self.zoom = 1.0
         self.offset = QPoint(0, 0)
         self.update()
 
+    def update_info_text(self):
+        """Recompute the overlay text for self.filename (once per image/label change, not per paint)"""
+        if not self.filename:
+            return
+        filename = self.filename
+        # Extract base name to check if this is a patch
+        base_name, xtl, ytl, xbr, ybr = extract_coordinates_from_filename(filename)
+
+        if None not in (xtl, ytl, xbr, ybr):
+            # This is a patch image - get its labels
+            self.current_labels = self.get_labels_for_image(filename)
+            info_text = f"{filename}\nLabels: {', '.join(self.current_labels)}"
+        else:
+            # This is a base image
+            self.current_labels = []
+            info_text = filename
+        self.image_info_label.setText(info_text)
+        self.info_text_width = self.image_info_label.sizeHint().width()
+
+    def on_labels_changed(self, img_names):
+        """Label store listener: refresh the overlay if the shown patch was edited"""
+        if self.filename in img_names and not self.showing_base:
+            self.update_info_text()
+            self.update()
+
     def paintEvent(self, event):
-        print("paint event ")
-        if self.pixmap:
+        if self.image is not None or self.pyramid:
             painter = QPainter(self)
-            scaled_pixmap = self.pixmap.scaled(
-                self.pixmap.size() * self.zoom,
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-            x = (self.width() - scaled_pixmap.width()) // 2 + self.offset.x()
-            y = (self.height() - scaled_pixmap.height()) // 2 + self.offset.y()
-            painter.drawPixmap(x, y, scaled_pixmap)
-
-
-            if self.filename:
-                filename = self.filename
-                print(f"Setting image with filename: {filename}")
-
-                print(f"Setting image with filename: {filename}")
-                self.filename = filename
-                
-                # Extract base name to check if this is a patch
-                base_name, xtl, ytl, xbr, ybr = extract_coordinates_from_filename(filename)
-                
-                if None not in (xtl, ytl, xbr, ybr):
-                    # This is a patch image - get its labels
-                    self.current_labels = self.get_labels_for_image(filename)
-                    info_text = f"{filename}\nLabels: {', '.join(self.current_labels)}"
-                else:
-                    # This is a base image
-                    self.current_labels = []
-                    info_text = filename
-                    
-
-                print("print 1")
-                self.image_info_label.setText(info_text)
-                print("print 2")
-
-
-
+            if self.pyramid:
+                self.draw_pyramid(painter)
+            else:
+                self.draw_image(painter)
 
 
             # Draw the info label
-            if hasattr(self, 'image_info_label') and self.image_info_label.text():
-                print("hasattr")
+            if self.image_info_label.text():
                 # Position label at bottom center
-                label_width = self.image_info_label.sizeHint().width()
+                label_width = self.info_text_width
                 label_x = (self.width() - label_width) // 2
                 label_y = self.height() - 40  # 40 pixels from bottom
                 
@@ -273,12 +247,138 @@ class ImagePanel(QLabel):
 
 
 
+    def draw_image(self, painter):
+        """Draw self.image at the current zoom/offset without rescaling it every paint"""
+        dpr = self.devicePixelRatioF()
+        scaled_size = self.image.size() * self.zoom
+        target = self.target_rect(self.image.width(), self.image.height())
+
+        key = (self.image.cacheKey(), round(self.zoom, 4), dpr)
+        rendition = self.scaled_cache.get(key)
+        if rendition is not None:
+            # Panning at a settled zoom level is a plain blit
+            self.scaled_cache.move_to_end(key)
+            painter.drawImage(target.topLeft(), rendition)
+        elif self.interacting or self.zoom * dpr >= 1:
+            # Let the painter transform only the visible part: fast while the
+            # user is dragging/zooming, bilinear once settled (upscaling never
+            # benefits from a pre-scaled copy, and it could be huge)
+            painter.setRenderHint(QPainter.SmoothPixmapTransform, not self.interacting)
+            painter.drawImage(target, self.image, QRectF(self.image.rect()))
+        else:
+            # Settled downscale: area-averaged rendition at device resolution, cached
+            rendition = self.image.scaled(
+                scaled_size * dpr,
+                Qt.KeepAspectRatio,
+                Qt.SmoothTransformation
+            )
+            rendition.setDevicePixelRatio(dpr)
+            self.scaled_cache[key] = rendition
+            while len(self.scaled_cache) > SCALED_CACHE_SIZE:
+                self.scaled_cache.popitem(last=False)
+            painter.drawImage(target.topLeft(), rendition)
+
+    def draw_pyramid(self, painter):
+        """Draw the visible tiles of the base image plus the patch's bounding box"""
+        target = self.target_rect(self.pyramid.width, self.pyramid.height)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, not self.interacting)
+        self.pyramid.draw(painter, target, self.rect(), self.devicePixelRatioF())
+        if self.pyramid.needs_full and self.full_requested != self.current_base_path:
+            # Zoomed past the preview: decode full resolution in the background
+            path = self.current_base_path
+            self.full_requested = path
+            self.when_decoded(get_prefetcher().base_future(path), self.full_image_ready, path)
+
+        if self.bbox_coords:
+            xtl, ytl, xbr, ybr = self.bbox_coords
+            painter.save()
+            painter.setPen(QPen(Qt.red, 3))
+            painter.setBrush(Qt.NoBrush)
+            painter.drawRect(QRectF(
+                target.left() + xtl * self.zoom, target.top() + ytl * self.zoom,
+                (xbr - xtl) * self.zoom, (ybr - ytl) * self.zoom
+            ))
+            painter.restore()
+
+    def when_decoded(self, future, signal, path):
+        """Emit `signal` on the GUI thread once the prefetch pool has finished `future`.
+
+        The decode never runs on the GUI thread; a prefetch that navigation
+        cancelled is queued on the pool again by the slot (see decoded()).
+        """
+        future.add_done_callback(lambda f: signal.emit(path, f))
+
+    def decoded(self, future, resubmit, signal, path):
+        """Result of a finished decode, or None if it was cancelled and has been queued again"""
+        if future.cancelled():
+            self.when_decoded(resubmit(path), signal, path)
+            return None
+        return future.result()
+
+    def on_full_image_ready(self, path, future):
+        if path != self.current_base_path or self.base_pyramid is None:
+            return
+        try:
+            pil_img = self.decoded(future, get_prefetcher().base_future, self.full_image_ready, path)
+        except Exception as e:
+            print(f"[ERROR] Full-resolution decode failed: {e}")
+            return
+        if pil_img is not None:
+            self.base_pyramid.set_full(pil_img)
+            self.update()
+
+    def on_preview_ready(self, path, future):
+        """Swap the patch for its base image once the preview decode is in"""
+        if path != self.current_base_path or not self.showing_base or self.pyramid is not None:
+            return
+        try:
+            pil_img = self.decoded(future, get_prefetcher().preview_future, self.preview_ready, path)
+        except Exception as e:
+            print(f"[ERROR] Failed to process base image: {e}")
+            return
+        if pil_img is None:
+            return
+        self.base_pyramid = ImagePyramid(pil_img, pil_img.info.get("draft_scale", 1),
+                                        pil_img.info.get("full_size"))
+        self.full_requested = None
+        self.pyramid = self.base_pyramid
+        self.zoom = self.fit_zoom()
+        self.offset = QPoint(0, 0)
+        self.update()
+
+    def fit_zoom(self):
+        """Zoom at which the whole base image fits the panel (never above 1:1)"""
+        fit = min(self.width() / self.pyramid.width, self.height() / self.pyramid.height)
+        return max(0.1, min(1.0, fit))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        # Base image previews are decoded just large enough to fill the panel
+        dpr = self.devicePixelRatioF()
+        get_prefetcher().preview_size = (max(1, int(self.width() * dpr)), max(1, int(self.height() * dpr)))
+
+    def target_rect(self, width, height):
+        """Widget rect of a width x height image at the current zoom, centred plus offset"""
+        scaled_width, scaled_height = int(width * self.zoom), int(height * self.zoom)
+        x = (self.width() - scaled_width) // 2 + self.offset.x()
+        y = (self.height() - scaled_height) // 2 + self.offset.y()
+        return QRectF(x, y, scaled_width, scaled_height)
+
+    def begin_interaction(self):
+        self.interacting = True
+        self.settle_timer.start()  # restarts on every event
+
+    def end_interaction(self):
+        self.interacting = False
+        self.update()
+
     def wheelEvent(self, event):
-        if self.pixmap:
+        if self.image is not None or self.pyramid:
             angle = event.angleDelta().y()
             factor = 1.1 if angle > 0 else 0.9
             self.zoom *= factor
             self.zoom = max(0.1, min(self.zoom, 10))
+            self.begin_interaction()
             self.update()
 
     def mousePressEvent(self, event):
@@ -290,6 +390,7 @@ class ImagePanel(QLabel):
             delta = event.pos() - self.drag_start_pos
             self.offset += delta
             self.drag_start_pos = event.pos()
+            self.begin_interaction()
             self.update()
 
     def mouseReleaseEvent(self, event):
@@ -312,17 +413,12 @@ class ImagePanel(QLabel):
                     return
 
                 # Look for base image with any extension
-                base_path = None
-                for ext in ['.jpg', '.JPG', '.jpeg', '.JPEG']:
-                    test_path = os.path.join("imgs", f"{base_name}{ext}")
-                    if os.path.exists(test_path):
-                        base_path = test_path
-                        print(f"[DEBUG] Found base image: {base_path}")
-                        break
+                base_path = find_base_image(base_name)
 
                 print("info 1")
                 info_text = f"{base_name}"
                 self.image_info_label.setText(info_text)
+                self.info_text_width = self.image_info_label.sizeHint().width()
                 print("info 2")
 
                 if not base_path:
@@ -334,36 +430,19 @@ class ImagePanel(QLabel):
                 self.current_base_path = base_path
                 print(f"[DEBUG] Bounding box coordinates: {self.bbox_coords}")
 
-                # Load base image with bounding box
-                pil_img = self.process_image(base_path, draw_bbox=True)
-                if pil_img is None:
-                    print("[ERROR] Failed to process base image")
-                    return
-
-                # Convert PIL Image to QImage properly
-                if pil_img.mode == "RGB":
-                    qimage = QImage(pil_img.tobytes(), pil_img.size[0], pil_img.size[1], 
-                                pil_img.size[0] * 3, QImage.Format_RGB888)
-                elif pil_img.mode == "RGBA":
-                    qimage = QImage(pil_img.tobytes(), pil_img.size[0], pil_img.size[1], 
-                                pil_img.size[0] * 4, QImage.Format_RGBA8888)
-                else:
-                    # Convert to RGB if in another format
-                    pil_img = pil_img.convert("RGB")
-                    qimage = QImage(pil_img.tobytes(), pil_img.size[0], pil_img.size[1], 
-                                pil_img.size[0] * 3, QImage.Format_RGB888)
-
-                self.base_pixmap = QPixmap.fromImage(qimage)
-                if self.base_pixmap.isNull():
-                    print("[ERROR] Failed to create QPixmap from base image")
-                    return
-
-                self.pixmap = self.base_pixmap
+                # Screen-sized reduced decode (usually already prefetched) in a
+                # tiled pyramid; the box is drawn as an overlay. The patch stays
+                # up until the decode is in.
                 self.showing_base = True
+                self.base_pyramid = None
+                self.when_decoded(get_prefetcher().preview_future(base_path), self.preview_ready, base_path)
+                return
             else:
                 print("[DEBUG] Reverting to patch image")
-                self.pixmap = self.patch_pixmap
+                self.image = self.patch_image
+                self.pyramid = None
                 self.showing_base = False
+                self.update_info_text()
 
             self.zoom = 1.0
             self.offset = QPoint(0, 0)
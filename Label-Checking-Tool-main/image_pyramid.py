@@ -0,0 +1,115 @@
+import math
+from collections import OrderedDict
+from PyQt5.QtCore import QRectF
+from image_loading import pil_to_qimage
+
+
+TILE_SIZE = 512
+MAX_TILES = 64  # ~64 MB of 512x512 tiles, several screens' worth
+MIN_LEVEL_SIZE = 256  # stop halving once the long side is this small
+
+
+class ImagePyramid:
+    """Multi-resolution, tiled view of one large (base) image.
+
+    Level 0 is the full-resolution image; level k is level k-1 halved with a
+    box filter and is only built the first time a zoom level that needs it is
+    drawn. Tiles become QImages only when they intersect the viewport, and are
+    kept in a small LRU, so drawing costs scale with the screen, not the camera.
+    They are painted with drawImage(), so no QPixmap copy is ever made.
+
+    A pyramid can start from a reduced JPEG decode (`scale` = 2, 4 or 8), which
+    is exactly level log2(scale). Finer levels are then missing: drawing them
+    sets `needs_full` and upsamples the preview until set_full() is called.
+    Pass the source's `full_size` with a preview; without it the size is
+    estimated as the preview size times `scale`.
+    """
+
+    def __init__(self, pil_img, scale=1, full_size=None, tile_size=TILE_SIZE, max_tiles=MAX_TILES):
+        self.first_level = int(round(math.log2(scale))) if scale > 1 else 0
+        # Shared with the prefetch cache, so only convert when we must
+        self.levels = {self.first_level: pil_img if pil_img.mode == "RGB" else pil_img.convert("RGB")}
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict()  # (level, tx, ty) -> QImage
+        self.needs_full = False
+        self._set_size(*(full_size or (pil_img.width * scale, pil_img.height * scale)))
+
+    def _set_size(self, width, height):
+        """Full-resolution size, in the coordinates boxes and zoom are expressed in"""
+        self.width = width
+        self.height = height
+        self.level_count = 1
+        while max(width, height) > MIN_LEVEL_SIZE:
+            width, height = (width + 1) // 2, (height + 1) // 2
+            self.level_count += 1
+
+    def set_full(self, pil_img):
+        """Swap in the full-resolution decode; coarser levels and tiles stay valid"""
+        self.levels[0] = pil_img if pil_img.mode == "RGB" else pil_img.convert("RGB")
+        for key in [key for key in self.tiles if key[0] < self.first_level]:
+            del self.tiles[key]
+        self.first_level = 0
+        self.needs_full = False
+        self._set_size(pil_img.width, pil_img.height)
+
+    def level_for(self, scale):
+        """Coarsest level that still has at least one source pixel per device pixel"""
+        if scale >= 1:
+            return 0
+        level = int(math.floor(math.log2(1.0 / scale)))
+        return min(level, self.level_count - 1)
+
+    def level_image(self, level):
+        level = max(level, self.first_level)
+        if level not in self.levels:
+            self.levels[level] = self.level_image(level - 1).reduce(2)
+        return self.levels[level]
+
+    def tile(self, level, tx, ty):
+        key = (level, tx, ty)
+        image = self.tiles.get(key)
+        if image is not None:
+            self.tiles.move_to_end(key)
+            return image
+        img = self.level_image(level)
+        x0, y0 = tx * self.tile_size, ty * self.tile_size
+        region = img.crop((x0, y0, min(x0 + self.tile_size, img.width), min(y0 + self.tile_size, img.height)))
+        image = pil_to_qimage(region)
+        self.tiles[key] = image
+        while len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+        return image
+
+    def draw(self, painter, target, clip, dpr=1.0):
+        """Draw the image into widget rect `target`, touching only tiles inside `clip`"""
+        zoom = target.width() / self.width
+        level = self.level_for(zoom * dpr)
+        if level < self.first_level:
+            self.needs_full = True  # zoomed in past what the preview resolves
+            level = self.first_level
+        img = self.level_image(level)
+        # Widget pixels per pixel of this level
+        step = zoom * (self.width / img.width)
+
+        visible = target.intersected(QRectF(clip))
+        if visible.isEmpty():
+            return
+        first_tx = max(0, int((visible.left() - target.left()) / step) // self.tile_size)
+        first_ty = max(0, int((visible.top() - target.top()) / step) // self.tile_size)
+        last_tx = min((img.width - 1) // self.tile_size, int((visible.right() - target.left()) / step) // self.tile_size)
+        last_ty = min((img.height - 1) // self.tile_size, int((visible.bottom() - target.top()) / step) // self.tile_size)
+
+        for ty in range(first_ty, last_ty + 1):
+            for tx in range(first_tx, last_tx + 1):
+                image = self.tile(level, tx, ty)
+                # Snap tile edges to whole widget pixels so neighbours never leave seams
+                left = round(target.left() + tx * self.tile_size * step)
+                top = round(target.top() + ty * self.tile_size * step)
+                right = round(target.left() + (tx * self.tile_size + image.width()) * step)
+                bottom = round(target.top() + (ty * self.tile_size + image.height()) * step)
+                painter.drawImage(QRectF(left, top, right - left, bottom - top), image, QRectF(image.rect()))
+
+    def to_qimage(self):
+        """Full-resolution QImage that owns its pixels (for copying to the clipboard)"""
+        return pil_to_qimage(self.level_image(0)).copy()
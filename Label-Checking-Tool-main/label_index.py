@@ -0,0 +1,120 @@
+import numpy as np
+
+
+# Number of set bits in every possible byte, for counting packed bitmaps
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class LabelBitmapIndex:
+    """One packed bitset per label column (plus Signed) over the rows of a labels table.
+
+    Bitmaps are np.packbits arrays, so a label-combination query is a handful of
+    vectorized AND/OR/NOT operations over rows / 8 bytes per label. A second
+    bitset per column marks the cells that are set at all, so an empty (NaN)
+    cell is neither "has the label" nor "does not have it".
+    """
+
+    def __init__(self, df, columns):
+        self.columns = list(columns)
+        self.rows_total = len(df)
+        self.bitmaps = {
+            col: np.packbits(df[col].to_numpy() == 1) for col in self.columns
+        }
+        self.known = {
+            col: np.packbits(df[col].notna().to_numpy()) for col in self.columns
+        }
+        # Padding bits past the last row must never show up in NOT results
+        self.valid = np.packbits(np.ones(self.rows_total, dtype=bool))
+
+    def set_bit(self, row, column, value):
+        """Keep the index in step with a single-cell edit"""
+        bitmap = self.bitmaps.get(column)
+        if bitmap is None:
+            return
+        mask = np.uint8(0x80 >> (row & 7))
+        if value == 1:
+            bitmap[row >> 3] |= mask
+        else:
+            bitmap[row >> 3] &= ~mask
+        known = self.known[column]
+        if value is None:
+            known[row >> 3] &= ~mask
+        else:
+            known[row >> 3] |= mask
+
+    def set_bits(self, rows, column, value):
+        """set_bit for many rows of one column in a single vectorized update"""
+        bitmap = self.bitmaps.get(column)
+        if bitmap is None:
+            return
+        rows = np.asarray(rows, dtype=np.int64)
+        masks = (0x80 >> (rows & 7)).astype(np.uint8)
+        if value == 1:
+            np.bitwise_or.at(bitmap, rows >> 3, masks)
+        else:
+            np.bitwise_and.at(bitmap, rows >> 3, ~masks)
+        if value is None:
+            np.bitwise_and.at(self.known[column], rows >> 3, ~masks)
+        else:
+            np.bitwise_or.at(self.known[column], rows >> 3, masks)
+
+    # ------------------------------------------------------------------
+    # Bitmap algebra
+    # ------------------------------------------------------------------
+    def empty(self):
+        return np.zeros_like(self.valid)
+
+    def bitmap(self, label):
+        """Bitset for one column; a column missing from the CSV is all zeros"""
+        bitmap = self.bitmaps.get(label)
+        return self.empty() if bitmap is None else bitmap
+
+    def all_of(self, labels):
+        """Rows that have every one of `labels`"""
+        result = self.valid.copy()
+        for label in labels:
+            result &= self.bitmap(label)
+        return result
+
+    def any_of(self, labels):
+        """Rows that have at least one of `labels`"""
+        result = self.empty()
+        for label in labels:
+            result |= self.bitmap(label)
+        return result
+
+    def excludes(self, labels):
+        """Rows where each of `labels` is filled in and not 1 (an empty cell is not a 0)"""
+        result = self.valid & ~self.any_of(labels)
+        for label in labels:
+            result &= self.known.get(label, self.valid)
+        return result
+
+    def exact(self, labels, label_columns=None):
+        """Rows whose label set is exactly `labels` (Signed is not a label)"""
+        label_columns = label_columns or [col for col in self.columns if col != "Signed"]
+        others = [col for col in label_columns if col not in set(labels)]
+        return self.all_of(labels) & self.excludes(others)
+
+    def query(self, all_of=(), any_of=(), excludes=()):
+        """Combine the three filters; an empty filter matches everything"""
+        result = self.all_of(all_of)
+        if any_of:
+            result &= self.any_of(any_of)
+        if excludes:
+            result &= self.excludes(excludes)
+        return result
+
+    # ------------------------------------------------------------------
+    # Results
+    # ------------------------------------------------------------------
+    def from_mask(self, mask):
+        """Pack a per-row boolean mask so it can be combined with the bitmaps"""
+        return np.packbits(np.asarray(mask, dtype=bool))
+
+    def rows(self, bitmap):
+        """Row positions set in `bitmap`, in table order"""
+        return np.flatnonzero(np.unpackbits(bitmap, count=self.rows_total))
+
+    def count(self, bitmap):
+        return int(_POPCOUNT[bitmap].sum())
@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+import time
+import threading
+from file_lock import FileLock, LockHeldError
+
+
+class LabelJournal:
+    """Append-only log of label edits kept next to output_cm.csv.
+
+    Every edit is one JSON line (image, column, old, new, ts); a bulk edit of
+    one column is a single line with "images" and a matching "old" list. The
+    CSV itself is only rewritten during compaction, which folds the journal
+    back into it.
+
+    Only one process may write a journal: the writer lock (<journal>.lock) is
+    taken here and held until close(). A second writer fails after
+    `lock_timeout` seconds (0: at once, None: wait) with LockHeldError.
+    """
+
+    def __init__(self, csv_path, fsync=False, lock_timeout=0):
+        self.path = csv_path + ".journal"
+        # Entries being folded into the CSV by a compaction still in progress
+        self.compacting_path = self.path + ".compacting"
+        self.fsync = fsync
+        try:
+            self._writer_lock = FileLock(self.path + ".lock").acquire(lock_timeout)
+        except LockHeldError:
+            raise LockHeldError(f"{csv_path} is being edited by another process "
+                                f"(close the labelling tool or wait for it to finish)") from None
+        self._lock = threading.Lock()
+        self._file = open(self.path, "a", encoding="utf-8")
+        self.pending = self._count_lines(self.path) + self._count_lines(self.compacting_path)
+
+    @staticmethod
+    def _count_lines(path):
+        if not os.path.exists(path):
+            return 0
+        with open(path, "r", encoding="utf-8") as f:
+            return sum(1 for line in f if line.strip())
+
+    def append(self, entries):
+        """Write a batch of {image, column, old, new} (or {images, ...}) dicts to the journal"""
+        if not entries:
+            return
+        ts = time.time()
+        lines = []
+        for entry in entries:
+            entry.setdefault("ts", ts)
+            lines.append(json.dumps(entry) + "\n")
+        with self._lock:
+            self._file.write("".join(lines))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.pending += len(lines)
+
+    def entries(self):
+        """All journaled edits in the order they were made"""
+        return self._read(self.compacting_path) + self._read(self.path)
+
+    def compacting_entries(self):
+        """The edits a running compaction is folding into the CSV"""
+        return self._read(self.compacting_path)
+
+    @staticmethod
+    def _read(path):
+        result = []
+        if not os.path.exists(path):
+            return result
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    result.append(json.loads(line))
+                except ValueError:
+                    # A crash mid-append can leave a partial last line
+                    print(f"Skipping corrupt journal line in {path}")
+        return result
+
+    def begin_compaction(self):
+        """Move current entries aside so new edits go to a fresh journal"""
+        with self._lock:
+            self._file.close()
+            if os.path.exists(self.compacting_path):
+                # An earlier compaction never finished - keep its entries too
+                with open(self.compacting_path, "a", encoding="utf-8") as dst, \
+                        open(self.path, "r", encoding="utf-8") as src:
+                    dst.write(src.read())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.compacting_path)
+            self._file = open(self.path, "a", encoding="utf-8")
+            compacted = self.pending
+            self.pending = 0
+            return compacted
+
+    def finish_compaction(self):
+        """The CSV now contains everything that was moved aside"""
+        if os.path.exists(self.compacting_path):
+            os.remove(self.compacting_path)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+        self._writer_lock.release()
+
+
+def journal_entries(csv_path):
+    """Every edit journaled for `csv_path`, read without taking the writer lock
+    (hold compaction_lock(csv_path, shared=True) to read it together with the CSV)"""
+    path = csv_path + ".journal"
+    return LabelJournal._read(path + ".compacting") + LabelJournal._read(path)
+
+
+def compaction_lock(csv_path, shared=False):
+    """Held exclusively while a compaction rotates the journal and rewrites the
+    CSV; readers take it shared so they never see one without the other."""
+    return FileLock(csv_path + ".journal.compacting.lock", shared)
+
+
+def write_csv_atomically(df, csv_path):
+    """Write to a temp file and swap it in so a crash never truncates the CSV"""
+    tmp_path = csv_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        df.to_csv(f, index=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, csv_path)
+
+
+if __name__ == "__main__":
+    # python label_journal.py [output_cm.csv]  - fold pending edits into the CSV
+    from label_store import LabelStore
+
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else "output_cm.csv"
+    try:
+        store = LabelStore(csv_path)
+    except LockHeldError as e:
+        print(e)
+        sys.exit(1)
+    pending = store.journal.pending
+    store.close()
+    print(f"Compacted {pending} journal entries into {csv_path}")
@@ -0,0 +1,174 @@
+import os
+import sys
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+
+NAME_COLUMN = "Image Name"
+COORD_COLUMNS = ["xtl", "ytl", "xbr", "ybr"]
+FORMAT_VERSION = 1
+
+
+def matrix_path_for(csv_path):
+    """output_cm.csv -> output_cm.lblm"""
+    return os.path.splitext(csv_path)[0] + ".lblm"
+
+
+def write_matrix(df, out_dir):
+    """Write a labels DataFrame as a bit-packed label matrix directory.
+
+    Layout of out_dir:
+        meta.json         column order, which columns are bits, coord dtype
+        labels.npy        uint8 (patches x ceil(labels / 8)), np.packbits rows
+        coords.npy        (patches x 4) xtl/ytl/xbr/ybr
+        names.bin         utf-8 image names, back to back
+        name_offsets.npy  int64 (patches + 1) byte offsets into names.bin
+    """
+    columns = list(df.columns)
+    coord_columns = [col for col in COORD_COLUMNS if col in df.columns]
+    label_columns = [col for col in columns if col != NAME_COLUMN and col not in coord_columns]
+
+    # Every label (and Signed) must be a clean 0/1 for the conversion to be lossless
+    labels = df[label_columns]
+    bad = [col for col in label_columns if not labels[col].isin([0, 1]).all()]
+    if bad:
+        raise ValueError(f"Columns are not 0/1 (run add_0's.py first?): {', '.join(bad)}")
+    bits = np.packbits(labels.to_numpy(dtype=bool), axis=1)
+
+    coords = df[coord_columns].to_numpy(dtype=np.float64)
+    if np.all(np.mod(coords, 1) == 0):
+        coords = coords.astype(np.int32)
+
+    encoded = [str(name).encode("utf-8") for name in df[NAME_COLUMN]]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(name) for name in encoded])
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "rows": len(df),
+        "columns": columns,
+        "label_columns": label_columns,
+        "coord_columns": coord_columns,
+        # dtypes the CSV parser produced, restored on the way back out
+        "dtypes": {col: str(df[col].dtype) for col in coord_columns + label_columns},
+    }
+
+    # Build next to the target and swap in, so readers never see half a matrix
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "labels.npy"), bits)
+    np.save(os.path.join(tmp_dir, "coords.npy"), coords)
+    np.save(os.path.join(tmp_dir, "name_offsets.npy"), offsets)
+    with open(os.path.join(tmp_dir, "names.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=1)
+
+    old_dir = out_dir + ".old"
+    if os.path.exists(out_dir):
+        shutil.rmtree(old_dir, ignore_errors=True)
+        os.rename(out_dir, old_dir)
+    os.rename(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+class LabelMatrix:
+    """Read-only, memory-mapped view of a .lblm directory"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported label matrix version in {path}")
+        self.columns = self.meta["columns"]
+        self.label_columns = self.meta["label_columns"]
+        self.coord_columns = self.meta["coord_columns"]
+        self.bit_of = {col: i for i, col in enumerate(self.label_columns)}
+
+        self.bits = np.load(os.path.join(path, "labels.npy"), mmap_mode="r")
+        self.coords = np.load(os.path.join(path, "coords.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "name_offsets.npy"), mmap_mode="r")
+        self._names_blob = np.memmap(os.path.join(path, "names.bin"), dtype=np.uint8, mode="r") \
+            if self.offsets[-1] else np.zeros(0, dtype=np.uint8)
+        self._names = None
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def name(self, row):
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return self._names_blob[start:end].tobytes().decode("utf-8")
+
+    def names(self):
+        """All image names (decoded once, then cached)"""
+        if self._names is None:
+            blob = self._names_blob.tobytes()
+            offsets = self.offsets.tolist()
+            self._names = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(self))]
+        return self._names
+
+    def label_bits(self, label):
+        """bool array (one entry per patch) for a single label column"""
+        bit = self.bit_of[label]
+        byte = np.asarray(self.bits[:, bit >> 3])
+        return ((byte >> (7 - (bit & 7))) & 1).astype(bool)
+
+    def label_counts(self):
+        """{label: number of patches with that label set}"""
+        return {label: int(self.label_bits(label).sum()) for label in self.label_columns}
+
+    def to_dataframe(self):
+        """Rebuild the exact table the matrix was written from"""
+        data = {NAME_COLUMN: self.names()}
+        dtypes = self.meta["dtypes"]
+        for i, col in enumerate(self.coord_columns):
+            data[col] = np.asarray(self.coords[:, i]).astype(dtypes[col])
+        if self.label_columns:
+            labels = np.unpackbits(np.asarray(self.bits), axis=1, count=len(self.label_columns))
+            for i, col in enumerate(self.label_columns):
+                data[col] = labels[:, i].astype(dtypes[col])
+        return pd.DataFrame(data, columns=self.columns)
+
+
+def csv_to_matrix(csv_path, out_dir=None):
+    out_dir = out_dir or matrix_path_for(csv_path)
+    write_matrix(pd.read_csv(csv_path), out_dir)
+    return out_dir
+
+
+def matrix_to_csv(matrix_dir, csv_path):
+    LabelMatrix(matrix_dir).to_dataframe().to_csv(csv_path, index=False)
+    return csv_path
+
+
+def load_labels(csv_path):
+    """Load a labels table, using the .lblm copy when it is at least as new as the CSV"""
+    matrix_dir = matrix_path_for(csv_path)
+    meta_path = os.path.join(matrix_dir, "meta.json")
+    if os.path.exists(meta_path) and (
+            not os.path.exists(csv_path) or os.path.getmtime(meta_path) >= os.path.getmtime(csv_path)):
+        try:
+            return LabelMatrix(matrix_dir).to_dataframe()
+        except Exception as e:
+            print(f"Error reading {matrix_dir}, falling back to CSV: {str(e)}")
+    return pd.read_csv(csv_path)
+
+
+if __name__ == "__main__":
+    # python label_matrix.py import output_cm.csv [output_cm.lblm]
+    # python label_matrix.py export output_cm.lblm output_cm.csv
+    if len(sys.argv) < 3 or sys.argv[1] not in ("import", "export"):
+        print("usage: label_matrix.py import|export SRC [DST]")
+        sys.exit(1)
+    if sys.argv[1] == "import":
+        out = csv_to_matrix(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+        print(f"Wrote label matrix {out}")
+    else:
+        if len(sys.argv) < 4:
+            print("export needs a destination CSV")
+            sys.exit(1)
+        print(f"Wrote {matrix_to_csv(sys.argv[2], sys.argv[3])}")
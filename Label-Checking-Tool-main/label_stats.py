@@ -0,0 +1,327 @@
+import os
+import sys
+import zipfile
+import argparse
+import numpy as np
+import pandas as pd
+from label_store import META_COLUMNS, LABEL_CSV
+from label_journal import journal_entries, compaction_lock
+
+
+CHUNK_ROWS = 100000
+GROUP_KINDS = ("base", "camera", "date")
+
+
+def csv_signature(csv_path):
+    try:
+        stat = os.stat(csv_path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def state_path_for(csv_path):
+    return csv_path + ".stats.npz"
+
+
+def group_keys(img_names):
+    """Base image, camera and capture date for every patch name (vectorized).
+
+    nihal_ooty_tnau_real_20230912_00124_0_0_373_346.jpg
+        base   nihal_ooty_tnau_real_20230912_00124
+        camera nihal_ooty_tnau_real   (everything before the YYYYMMDD token)
+        date   20230912
+    Names without a date token fall into "unknown".
+    """
+    names = pd.Series(img_names, dtype=object).astype(str).reset_index(drop=True)
+    stems = names.str.replace(r"\.[^._]*$", "", regex=True)
+    # Same rule as name_index.base_name_of: drop the four coordinate fields
+    has_coords = stems.str.count("_") >= 4
+    bases = stems.where(~has_coords, stems.str.rsplit("_", n=4).str[0])
+    parts = bases.str.extract(r"^(?:(?P<camera>.*?)_)?(?P<date>\d{8})(?:_|$)")
+    cameras = parts["camera"].fillna("unknown")
+    cameras = cameras.where(parts["date"].notna(), "unknown")
+    dates = parts["date"].fillna("unknown")
+    return {"base": bases.to_numpy(), "camera": cameras.to_numpy(), "date": dates.to_numpy()}
+
+
+class LabelStats:
+    """Label counts, co-occurrence, signed/unsigned and per-group breakdowns.
+
+    Everything is a sum over rows, so a frame can be added (one pass over
+    streamed chunks) or removed again; journal edits are applied by removing a
+    row's old label vector and adding the new one instead of recomputing.
+    """
+
+    def __init__(self, label_columns):
+        self.label_columns = list(label_columns)
+        size = len(self.label_columns)
+        self.rows = 0
+        self.signed_rows = 0
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.signed_counts = np.zeros(size, dtype=np.int64)
+        self.cooccurrence = np.zeros((size, size), dtype=np.int64)
+        # kind -> DataFrame indexed by group, columns Patches, Signed, <labels>
+        self.groups = {kind: None for kind in GROUP_KINDS}
+        self.csv_signature = None
+        self.consumed = 0  # journal entries already applied on top of the CSV
+
+    def add_frame(self, df, sign=1):
+        """Add (sign=1) or remove (sign=-1) the rows of a labels frame"""
+        if not len(df):
+            return
+        present = [col for col in self.label_columns if col in df.columns]
+        labels = np.zeros((len(df), len(self.label_columns)), dtype=np.int64)
+        for i, col in enumerate(self.label_columns):
+            if col in present:
+                labels[:, i] = (df[col].to_numpy() == 1)
+        signed = (df["Signed"].to_numpy() == 1).astype(np.int64) if "Signed" in df else np.zeros(len(df), dtype=np.int64)
+
+        self.rows += sign * len(df)
+        self.signed_rows += sign * int(signed.sum())
+        self.counts += sign * labels.sum(axis=0)
+        self.signed_counts += sign * (labels.T @ signed)
+        self.cooccurrence += sign * (labels.T @ labels)
+
+        frame = pd.DataFrame(labels, columns=self.label_columns)
+        frame.insert(0, "Signed", signed)
+        frame.insert(0, "Patches", 1)
+        for kind, keys in group_keys(df["Image Name"].to_numpy()).items():
+            grouped = frame.groupby(keys, sort=False).sum() * sign
+            current = self.groups[kind]
+            self.groups[kind] = grouped if current is None else current.add(grouped, fill_value=0)
+
+    def apply_entries(self, entries, df, row_of):
+        """Fold journal entries into the stats.
+
+        `df` must already contain the entries (e.g. a LabelStore's table or a
+        compaction snapshot) and `row_of` map image names to its rows. Each
+        touched row's old vector is rebuilt by undoing the entries in reverse.
+        """
+        images = [img for img in entry_images(entries) if img in row_of]
+        if not images:
+            return
+        columns = ["Image Name", "Signed"] + [col for col in self.label_columns if col in df.columns]
+        new = df.iloc[[row_of[img] for img in images]][columns].reset_index(drop=True)
+        old = new.astype(object)
+        position = {img: i for i, img in enumerate(images)}
+        for entry in reversed(entries):
+            column = entry.get("column")
+            if column not in old.columns:
+                continue
+            if "images" in entry:
+                pairs = zip(entry["images"], entry.get("old", []))
+            else:
+                pairs = [(entry.get("image"), entry.get("old"))]
+            for img, value in pairs:
+                if img in position:
+                    old.iat[position[img], old.columns.get_loc(column)] = np.nan if value is None else value
+        self.add_frame(old, sign=-1)
+        self.add_frame(new)
+
+    # ------------------------------------------------------------------
+    # Reports
+    # ------------------------------------------------------------------
+    def label_counts(self):
+        """Label,Count - the label_counts.csv format (Signed listed last, as before)"""
+        counts = pd.DataFrame({"Label": self.label_columns, "Count": self.counts})
+        return pd.concat([counts, pd.DataFrame({"Label": ["Signed"], "Count": [self.signed_rows]})],
+                         ignore_index=True)
+
+    def signed_breakdown(self):
+        return pd.DataFrame({
+            "Label": self.label_columns,
+            "Signed": self.signed_counts,
+            "Unsigned": self.counts - self.signed_counts,
+            "Count": self.counts,
+        })
+
+    def cooccurrence_frame(self):
+        return pd.DataFrame(self.cooccurrence, index=self.label_columns, columns=self.label_columns)
+
+    def group_frame(self, kind):
+        grouped = self.groups[kind]
+        if grouped is None:
+            return pd.DataFrame(columns=["Patches", "Signed"] + self.label_columns)
+        grouped = grouped[grouped["Patches"] > 0].astype(np.int64).sort_index()
+        grouped.index.name = kind
+        return grouped
+
+    def write_reports(self, out_dir=".", counts_name="label_counts.csv"):
+        os.makedirs(out_dir, exist_ok=True)
+        paths = {
+            counts_name: lambda path: self.label_counts().to_csv(path, index=False),
+            "label_counts_by_signed.csv": lambda path: self.signed_breakdown().to_csv(path, index=False),
+            "label_cooccurrence.csv": lambda path: self.cooccurrence_frame().to_csv(path),
+        }
+        for kind in GROUP_KINDS:
+            paths[f"label_counts_by_{kind}.csv"] = lambda path, kind=kind: self.group_frame(kind).to_csv(path)
+        written = []
+        for name, write in paths.items():
+            path = os.path.join(out_dir, name)
+            write(path)
+            written.append(path)
+        return written
+
+    # ------------------------------------------------------------------
+    # Persistence (for incremental updates)
+    # ------------------------------------------------------------------
+    def save(self, path):
+        """Write the counters as plain arrays (.npz), not a pickled object"""
+        arrays = {
+            "label_columns": np.array(self.label_columns, dtype=str),
+            "totals": np.array([self.rows, self.signed_rows, self.consumed], dtype=np.int64),
+            "csv_signature": np.array(self.csv_signature or [], dtype=np.int64),
+            "counts": self.counts,
+            "signed_counts": self.signed_counts,
+            "cooccurrence": self.cooccurrence,
+        }
+        for kind in GROUP_KINDS:
+            grouped = self.groups[kind]
+            if grouped is not None:
+                arrays[f"{kind}_keys"] = grouped.index.to_numpy(dtype=str)
+                arrays[f"{kind}_values"] = grouped[["Patches", "Signed"] + self.label_columns].to_numpy(dtype=np.int64)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        """Stats saved by save(), or None if the file is missing or unreadable"""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                stats = LabelStats(data["label_columns"].tolist())
+                stats.rows, stats.signed_rows, stats.consumed = (int(v) for v in data["totals"])
+                signature = data["csv_signature"].tolist()
+                stats.csv_signature = tuple(signature) if signature else None
+                stats.counts = data["counts"]
+                stats.signed_counts = data["signed_counts"]
+                stats.cooccurrence = data["cooccurrence"]
+                for kind in GROUP_KINDS:
+                    if f"{kind}_keys" in data:
+                        stats.groups[kind] = pd.DataFrame(
+                            data[f"{kind}_values"], index=data[f"{kind}_keys"].astype(object),
+                            columns=["Patches", "Signed"] + stats.label_columns)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+        return stats
+
+
+def compute(csv_path, chunksize=CHUNK_ROWS):
+    """One streaming pass over a labels CSV; memory is bounded by the chunk size"""
+    signature = csv_signature(csv_path)
+    stats = None
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        if stats is None:
+            stats = LabelStats([col for col in chunk.columns if col not in META_COLUMNS])
+        stats.add_frame(chunk)
+    if stats is None:
+        stats = LabelStats([])
+    stats.csv_signature = signature
+    return stats
+
+
+def entry_images(entries):
+    """Image names touched by journal entries, in first-touched order"""
+    images = []
+    for entry in entries:
+        images.extend(entry["images"] if "images" in entry else [entry.get("image")])
+    return list(dict.fromkeys(images))
+
+
+def read_rows(csv_path, images, chunksize=CHUNK_ROWS):
+    """The CSV rows of `images` (first occurrence of each), streamed a chunk at a time"""
+    wanted = set(images)
+    found = []
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        found.append(chunk[chunk["Image Name"].isin(wanted)])
+    if not found:
+        return pd.DataFrame(columns=["Image Name", "Signed"])
+    rows = pd.concat(found, ignore_index=True)
+    return rows.drop_duplicates("Image Name", keep="first").reset_index(drop=True)
+
+
+def replay_onto(rows, entries):
+    """Copy of `rows` with journal entries applied forward (cells outside `rows` are ignored)"""
+    result = rows.astype(object)
+    position = {img: i for i, img in enumerate(result["Image Name"])}
+    for entry in entries:
+        column = entry.get("column")
+        if column not in result.columns:
+            continue
+        new = np.nan if entry.get("new") is None else entry.get("new")
+        col = result.columns.get_loc(column)
+        for img in (entry["images"] if "images" in entry else [entry.get("image")]):
+            if img in position:
+                result.iat[position[img], col] = new
+    return result
+
+
+def update(csv_path, chunksize=CHUNK_ROWS):
+    """Saved stats plus any journal entries made since; full pass if the CSV changed underneath.
+
+    Reads the journal directly (no LabelStore, no writer lock) and only the
+    CSV rows the new entries touch.
+    """
+    state_path = state_path_for(csv_path)
+    stats = LabelStats.load(state_path)
+    # Shared: a compaction cannot swap the CSV and journal while we read them
+    with compaction_lock(csv_path, shared=True):
+        if stats is None or stats.csv_signature != csv_signature(csv_path):
+            print(f"No up-to-date stats for {csv_path}; computing from scratch")
+            stats = compute(csv_path, chunksize)
+            stats.consumed = 0
+        entries = journal_entries(csv_path)
+        new_entries = entries[stats.consumed:]
+        if new_entries:
+            rows = read_rows(csv_path, entry_images(new_entries), chunksize)
+            # The stats already include the first `consumed` entries
+            old = replay_onto(rows, entries[:stats.consumed])
+            stats.add_frame(old, sign=-1)
+            stats.add_frame(replay_onto(old, new_entries))
+        stats.consumed = len(entries)
+    print(f"Applied {len(new_entries)} journal entries")
+    stats.save(state_path)
+    return stats
+
+
+def refresh_after_compaction(csv_path, old_signature, folded_entries, snapshot, row_of):
+    """Called by LabelStore.compact(): carry saved stats over to the rewritten CSV.
+
+    `folded_entries` are the journal entries the compaction wrote into the CSV;
+    the ones the stats had not seen yet are applied from the snapshot.
+    """
+    state_path = state_path_for(csv_path)
+    stats = LabelStats.load(state_path)
+    if stats is None or stats.csv_signature != old_signature:
+        return  # stale or missing - the next update() recomputes
+    unseen = folded_entries[stats.consumed:]
+    if unseen:
+        stats.apply_entries(unseen, snapshot, row_of)
+    stats.consumed = max(0, stats.consumed - len(folded_entries))
+    stats.csv_signature = csv_signature(csv_path)
+    stats.save(state_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Label statistics for a labels CSV.")
+    parser.add_argument("command", choices=("compute", "update"), nargs="?", default="update",
+                        help="full streaming pass, or apply journal edits to the saved stats")
+    parser.add_argument("csv", nargs="?", default=LABEL_CSV)
+    parser.add_argument("-o", "--out", default=".", help="directory for the report CSVs")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    if args.command == "compute":
+        stats = compute(args.csv, args.chunksize)
+        stats.save(state_path_for(args.csv))
+    else:
+        stats = update(args.csv, args.chunksize)
+    for path in stats.write_reports(args.out):
+        print(f"Wrote {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
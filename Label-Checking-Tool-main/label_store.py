@@ -0,0 +1,371 @@
+import os
+import threading
+import numpy as np
+from label_journal import LabelJournal, write_csv_atomically, compaction_lock, journal_entries
+from label_matrix import load_labels, matrix_path_for, write_matrix
+from label_index import LabelBitmapIndex
+from name_index import NameIndex
+from signoff_aggregates import SignOffAggregates
+
+
+LABEL_CSV = "output_cm.csv"
+# Columns of output_cm.csv that are not disease labels
+META_COLUMNS = ["Image Name", "Signed", "xtl", "ytl", "xbr", "ybr"]
+
+
+class LabelStore:
+    """Single in-memory copy of output_cm.csv, indexed by "Image Name".
+
+    Widgets query labels through the store instead of re-reading the CSV and
+    subscribe to it to hear about edits made elsewhere in the tool. Edits are
+    appended to a LabelJournal and folded into the CSV by compact().
+
+    A read_only store replays the journal another process is writing without
+    locking it or ever compacting; its edits stay in memory (export_csv() them
+    elsewhere).
+    """
+
+    def __init__(self, csv_path=LABEL_CSV, journal=True, lock_timeout=0, read_only=False):
+        self.csv_path = csv_path
+        self.read_only = read_only
+        # Raises LockHeldError if another process is already writing this CSV
+        self.journal = LabelJournal(csv_path, lock_timeout=lock_timeout) if journal and not read_only else None
+        self._listeners = []
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()  # one compaction at a time
+        self._compactor = None
+        self._stop_compactor = threading.Event()
+        self.reload()
+
+    def reload(self):
+        """(Re)load the CSV from disk, replay the journal and rebuild the lookup tables"""
+        with self._lock:
+            if self.read_only:
+                # Not in the middle of a compaction: the CSV and journal agree
+                with compaction_lock(self.csv_path, shared=True):
+                    self.df = load_labels(self.csv_path)
+                    self._rebuild_index()
+                    self._replay(journal_entries(self.csv_path))
+            else:
+                self.df = load_labels(self.csv_path)  # fast path via output_cm.lblm if fresh
+                self._rebuild_index()
+                if self.journal is not None:
+                    self._replay(self.journal.entries())
+        self._notify(list(self.row_of))
+
+    def _replay(self, entries):
+        for entry in entries:
+            col = self.col_of.get(entry.get("column"))
+            new = entry.get("new")
+            if "images" in entry:
+                # Bulk edit: one column, one value, many images
+                rows = [self.row_of.get(name) for name in entry["images"]]
+                rows = [row for row in rows if row is not None]
+                if col is None or len(rows) != len(entry["images"]):
+                    print(f"Skipping unknown cells in bulk journal entry for {entry.get('column')}")
+                if col is not None and rows:
+                    self.df.iloc[rows, col] = float("nan") if new is None else new
+                continue
+            row = self.row_of.get(entry.get("image"))
+            if row is None or col is None:
+                print(f"Skipping journal entry for unknown cell: {entry}")
+                continue
+            self.df.iat[row, col] = float("nan") if new is None else new
+
+    def _rebuild_index(self):
+        # First occurrence wins, same as the old `df[...].iloc[0]` lookups
+        self.row_of = {}
+        for row, name in enumerate(self.df["Image Name"]):
+            self.row_of.setdefault(name, row)
+        self.col_of = {col: i for i, col in enumerate(self.df.columns)}
+        self.label_columns = [col for col in self.df.columns if col not in META_COLUMNS]
+        self._bitmap_index = None  # built on first search
+        self._name_indexes = {}  # case_sensitive -> NameIndex
+        self._sign_off_aggregates = None
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def __contains__(self, img_name):
+        return img_name in self.row_of
+
+    def __len__(self):
+        return len(self.df)
+
+    def image_names(self):
+        return self.df["Image Name"].tolist()
+
+    def value(self, img_name, column):
+        """Return a single cell, or None if the image/column is unknown"""
+        row = self.row_of.get(img_name)
+        col = self.col_of.get(column)
+        if row is None or col is None:
+            return None
+        return self.df.iat[row, col]
+
+    def is_signed(self, img_name):
+        return self.value(img_name, "Signed") == 1
+
+    def active_labels(self, img_name):
+        """Full label names that are set to 1 for this image"""
+        row = self.row_of.get(img_name)
+        if row is None:
+            return []
+        values = self.df.iloc[row]
+        return [col for col in self.label_columns if values[col] == 1]
+
+    def bitmap_index(self):
+        """Per-label bitsets (plus Signed), built once and updated on every edit"""
+        with self._lock:
+            if self._bitmap_index is None:
+                columns = self.label_columns + (["Signed"] if "Signed" in self.col_of else [])
+                self._bitmap_index = LabelBitmapIndex(self.df, columns)
+            return self._bitmap_index
+
+    def name_index(self, case_sensitive=True):
+        """Sorted name index for prefix / base-image lookups (names never change on edit)"""
+        with self._lock:
+            if case_sensitive not in self._name_indexes:
+                self._name_indexes[case_sensitive] = NameIndex(self.image_names(), case_sensitive)
+            return self._name_indexes[case_sensitive]
+
+    def sign_off_aggregates(self):
+        """Per-base-image (total, signed) counts, updated incrementally on every edit"""
+        with self._lock:
+            if self._sign_off_aggregates is None:
+                self._sign_off_aggregates = SignOffAggregates(
+                    self.name_index(case_sensitive=False), self.df["Signed"].to_numpy())
+            return self._sign_off_aggregates
+
+    def patches_of(self, base_name):
+        """Names of all patches cut from one base image"""
+        return self.names_at(self.name_index().rows_of_base(base_name))
+
+    def names_at(self, rows):
+        """Image names for a sequence of row positions"""
+        return self.df["Image Name"].to_numpy()[rows].tolist()
+
+    # ------------------------------------------------------------------
+    # Edits
+    # ------------------------------------------------------------------
+    def set_values(self, img_name, updates):
+        """Apply {column: value} to one image, journal it and notify listeners"""
+        row = self.row_of.get(img_name)
+        if row is None:
+            raise KeyError(f"Image {img_name} not found in {self.csv_path}")
+        entries = []
+        with self._lock:
+            for column, value in updates.items():
+                col = self.col_of.get(column)
+                if col is None:
+                    continue
+                old = _plain(self.df.iat[row, col])
+                new = _plain(value)
+                if old == new:
+                    continue
+                self.df.iat[row, col] = value
+                if self._bitmap_index is not None:
+                    self._bitmap_index.set_bit(row, column, new)
+                if column == "Signed" and self._sign_off_aggregates is not None:
+                    self._sign_off_aggregates.signed_changed(img_name, old, new)
+                entries.append({"image": img_name, "column": column, "old": old, "new": new})
+            if self.journal is not None:
+                self.journal.append(entries)
+        self._notify([img_name])
+
+    def set_values_many(self, img_names, updates):
+        """Apply the same {column: value} to many images in one vectorized write.
+
+        Each changed column is journaled as a single bulk entry and listeners
+        are notified once for the whole batch.
+        """
+        rows = self.rows_of(img_names)
+        if not len(rows):
+            return
+        names = self.df["Image Name"].to_numpy()
+        entries = []
+        with self._lock:
+            for column, value in updates.items():
+                col = self.col_of.get(column)
+                if col is None:
+                    continue
+                new = _plain(value)
+                current = self.df.iloc[rows, col]
+                # NaN never equals a value, so unset cells always count as changed
+                changed = (current.notna() if new is None else current.ne(value)).to_numpy()
+                if not changed.any():
+                    continue
+                changed_rows = rows[changed]
+                old = [_plain(v) for v in current.to_numpy()[changed]]
+                self.df.iloc[changed_rows, col] = float("nan") if new is None else value
+                if self._bitmap_index is not None:
+                    self._bitmap_index.set_bits(changed_rows, column, new)
+                if column == "Signed" and self._sign_off_aggregates is not None:
+                    self._sign_off_aggregates.signed_changed_many(changed_rows, old, new)
+                entries.append({"images": names[changed_rows].tolist(), "column": column,
+                                "old": old, "new": new})
+            if self.journal is not None:
+                self.journal.append(entries)
+        self._notify(names[rows].tolist())
+
+    def copy_labels(self, source, targets, sign=True):
+        """Give every target the source image's full label vector (and sign them off).
+
+        Targets missing from the table are skipped, as the old per-image loop
+        did, and returned so the caller can report them.
+        """
+        if source not in self.row_of:
+            raise KeyError(f"Image {source} not found in {self.csv_path}")
+        updates = {col: self.value(source, col) for col in self.label_columns}
+        if sign:
+            updates["Signed"] = 1
+        known = [name for name in targets if name in self.row_of]
+        skipped = [name for name in targets if name not in self.row_of]
+        for name in skipped:
+            print(f"Image {name} not found in {self.csv_path}, skipped")
+        self.set_values_many(known, updates)
+        return skipped
+
+    def rows_of(self, img_names):
+        """Sorted, de-duplicated table rows for image names; unknown names are an error"""
+        img_names = list(img_names)
+        rows = [self.row_of.get(name) for name in img_names]
+        missing = [name for name, row in zip(img_names, rows) if row is None]
+        if missing:
+            raise KeyError(f"{len(missing)} image(s) not found in {self.csv_path}, e.g. {missing[0]}")
+        return np.unique(np.array(rows, dtype=np.int64))
+
+    def save(self):
+        """Persist all edits to the CSV (compacts the journal if there is one)"""
+        if self.read_only:
+            raise RuntimeError(f"{self.csv_path} was opened read-only")
+        if self.journal is not None:
+            self.compact()
+        else:
+            self.export_csv(self.csv_path)
+
+    def export_csv(self, path):
+        if self.read_only and os.path.abspath(path) == os.path.abspath(self.csv_path):
+            raise RuntimeError(f"{self.csv_path} was opened read-only")
+        with self._lock:
+            snapshot = self.df.copy()
+        write_csv_atomically(snapshot, path)
+        if path == self.csv_path:
+            self._refresh_matrix(snapshot)
+
+    def compact(self):
+        """Fold journaled edits into the CSV without blocking new edits for long"""
+        if self.journal is None:
+            return
+        with self._compact_lock, compaction_lock(self.csv_path):
+            with self._lock:
+                if not self.journal.pending:
+                    return
+                # Journal rotation and snapshot happen together, so the snapshot
+                # holds exactly the edits that were moved aside
+                self.journal.begin_compaction()
+                snapshot = self.df.copy()
+            # Saved label stats describe the CSV as it is now; remember which one
+            stats_signature = self._stats_signature()
+            write_csv_atomically(snapshot, self.csv_path)
+            if stats_signature is not None:
+                self._refresh_stats(snapshot, stats_signature)
+            self.journal.finish_compaction()
+            self._refresh_matrix(snapshot)
+
+    def _refresh_matrix(self, snapshot):
+        """Keep an existing output_cm.lblm in step with the CSV"""
+        matrix_dir = matrix_path_for(self.csv_path)
+        if not os.path.exists(matrix_dir):
+            return
+        try:
+            write_matrix(snapshot, matrix_dir)
+        except Exception as e:
+            print(f"Error refreshing {matrix_dir}: {str(e)}")
+
+    def _stats_signature(self):
+        """Signature of the CSV if label_stats.py has saved stats for it, else None"""
+        from label_stats import csv_signature, state_path_for
+        if not os.path.exists(state_path_for(self.csv_path)):
+            return None
+        return csv_signature(self.csv_path)
+
+    def _refresh_stats(self, snapshot, old_signature):
+        """Fold the compacted edits into the saved label stats"""
+        try:
+            from label_stats import refresh_after_compaction
+            refresh_after_compaction(self.csv_path, old_signature, self.journal.compacting_entries(),
+                                     snapshot, self.row_of)
+        except Exception as e:
+            print(f"Error refreshing label stats for {self.csv_path}: {str(e)}")
+
+    def start_auto_compaction(self, interval=60):
+        """Compact in a background thread every `interval` seconds"""
+        if self._compactor is not None:
+            return
+        self._stop_compactor.clear()
+
+        def run():
+            while not self._stop_compactor.wait(interval):
+                try:
+                    if self.journal.pending:
+                        self.compact()
+                except Exception as e:
+                    print(f"Error compacting {self.csv_path}: {str(e)}")
+
+        self._compactor = threading.Thread(target=run, name="label-compactor", daemon=True)
+        self._compactor.start()
+
+    def close(self):
+        """Stop background compaction and flush everything to the CSV"""
+        if self._compactor is not None:
+            self._stop_compactor.set()
+            self._compactor.join()
+            self._compactor = None
+        if not self.read_only:
+            self.save()
+        if self.journal is not None:
+            self.journal.close()
+
+    # ------------------------------------------------------------------
+    # Change notifications
+    # ------------------------------------------------------------------
+    def subscribe(self, callback):
+        """callback(list_of_image_names) is called after every edit"""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, img_names):
+        for callback in list(self._listeners):
+            try:
+                callback(img_names)
+            except Exception as e:
+                print(f"Error in label listener {callback}: {str(e)}")
+
+
+def _plain(value):
+    """numpy/pandas scalar -> JSON-friendly Python value (NaN -> None)"""
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float):
+        if value != value:
+            return None
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+_shared_store = None
+
+
+def get_store(csv_path=LABEL_CSV):
+    """Return the process-wide LabelStore, loading it on first use"""
+    global _shared_store
+    if _shared_store is None:
+        # Give a batch tool (sign_off.py, ...) a moment to finish with the journal
+        _shared_store = LabelStore(csv_path, lock_timeout=10)
+    return _shared_store
@@ -0,0 +1,218 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+from label_store import META_COLUMNS
+from label_journal import write_csv_atomically
+
+
+POLICIES = ("signed-wins", "newest-wins", "union", "intersection")
+CHUNK_ROWS = 50000
+COORD_COLUMNS = ["xtl", "ytl", "xbr", "ybr"]
+
+
+class LabelMerger:
+    """Merges other reviewers' exports into a base labels table, keyed on "Image Name".
+
+    The base table is held in memory as float matrices; every other file is
+    streamed in chunks and joined through a hash index (pandas get_indexer),
+    so a merge is linear in the number of rows. Policies:
+
+      signed-wins   take the other row when it is signed and ours is not
+                    (what csv_combiner.py used to do); both signed and
+                    different is a conflict and ours is kept
+      newest-wins   rows that differ take the values from the most recently
+                    modified file (file mtime)
+      union         a label is set if either side has it; signed if either is
+      intersection  a label is set only if both sides have it; signed only if both are
+    """
+
+    def __init__(self, base_df, policy="signed-wins", base_mtime=0.0, add_new=False):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown merge policy {policy!r}, expected one of {', '.join(POLICIES)}")
+        self.policy = policy
+        self.add_new = add_new
+        self.columns = list(base_df.columns)
+        self.dtypes = base_df.dtypes.to_dict()
+        self.label_columns = [col for col in self.columns if col not in META_COLUMNS]
+        self.coord_columns = [col for col in COORD_COLUMNS if col in self.columns]
+
+        self.names = base_df["Image Name"].to_numpy(dtype=object)
+        # Hash index over the first occurrence of every name (later duplicates are left alone)
+        first = ~pd.Index(self.names).duplicated(keep="first")
+        self.first_row = np.flatnonzero(first)
+        self.index = pd.Index(self.names[first])
+        # Copies: these are written in place, and pandas may hand out read-only views
+        self.labels = base_df[self.label_columns].to_numpy(dtype=np.float64, copy=True)
+        self.signed = (base_df["Signed"].to_numpy(dtype=np.float64, copy=True) if "Signed" in base_df
+                       else np.zeros(len(base_df)))
+        self.coords = base_df[self.coord_columns].to_numpy(dtype=np.float64, copy=True)
+        self.row_mtime = np.full(len(base_df), base_mtime)
+
+        self.new_rows = []  # chunks of rows only present in other files (add_new)
+        self.conflicts = []  # report DataFrames
+        self.stats = {"matched": 0, "updated": 0, "conflicts": 0, "only_in_other": 0}
+        self.unsigned_sources = set()  # files without a Signed column, already warned about
+
+    def merge_file(self, path, chunksize=CHUNK_ROWS):
+        mtime = os.path.getmtime(path)
+        seen = np.zeros(len(self.names), dtype=bool)
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            self.merge_chunk(chunk, mtime, seen, source=path)
+
+    def merge_chunk(self, chunk, mtime, seen, source=""):
+        positions = self.index.get_indexer(chunk["Image Name"])
+        known = positions >= 0
+        if self.add_new and (~known).any():
+            self.new_rows.append(chunk[~known])
+        self.stats["only_in_other"] += int((~known).sum())
+
+        rows = self.first_row[positions[known]] if known.any() else np.array([], dtype=np.int64)
+        other = chunk[known]
+        # Only the first occurrence of a name in the other file counts
+        _, first = np.unique(rows, return_index=True)
+        keep = np.zeros(len(rows), dtype=bool)
+        keep[first] = True
+        keep &= ~seen[rows]
+        rows, other = rows[keep], other[keep]
+        seen[rows] = True
+        if not len(rows):
+            return
+        self.stats["matched"] += len(rows)
+
+        # Columns the other export lacks keep our values
+        ours = self.labels[rows]
+        theirs = ours.copy()
+        for i, col in enumerate(self.label_columns):
+            if col in other.columns:
+                theirs[:, i] = other[col].to_numpy(dtype=np.float64)
+        our_signed = self.signed[rows]
+        if "Signed" in other:
+            their_signed = other["Signed"].to_numpy(dtype=np.float64)
+        else:
+            # No sign-off information: the other side neither signs nor unsigns
+            if source not in self.unsigned_sources:
+                self.unsigned_sources.add(source)
+                print(f"Warning: {source or 'merged file'} has no Signed column; keeping the base's Signed values")
+            their_signed = our_signed.copy()
+
+        both_nan = np.isnan(ours) & np.isnan(theirs)
+        differs = ((ours != theirs) & ~both_nan).any(axis=1)
+
+        if self.policy == "signed-wins":
+            take = (our_signed != 1) & (their_signed == 1)
+            conflict = (our_signed == 1) & (their_signed == 1) & differs
+            self._take(rows[take], theirs[take], their_signed[take], other[take])
+            resolution = "kept base (both signed)"
+        elif self.policy == "newest-wins":
+            newer = mtime > self.row_mtime[rows]
+            take = (differs | (our_signed != their_signed)) & newer
+            conflict = differs
+            self._take(rows[take], theirs[take], their_signed[take], other[take])
+            self.row_mtime[rows[take]] = mtime
+            resolution = np.where(newer[conflict], "took newer file", "kept newer base")
+        else:
+            combine = np.fmax if self.policy == "union" else np.fmin
+            merged = combine(ours, theirs)
+            merged_signed = combine(our_signed, their_signed)
+            take = differs | (our_signed != merged_signed)
+            conflict = differs
+            self.labels[rows[take]] = merged[take]
+            self.signed[rows[take]] = merged_signed[take]
+            self.stats["updated"] += int(take.sum())
+            resolution = self.policy
+
+        if conflict.any():
+            self._report(rows[conflict], ours[conflict], theirs[conflict], source,
+                         resolution if np.ndim(resolution) else [resolution] * int(conflict.sum()))
+
+    def _take(self, rows, labels, signed, other):
+        """Copy another file's whole row (labels, Signed, coordinates) over ours"""
+        if not len(rows):
+            return
+        self.labels[rows] = labels
+        self.signed[rows] = signed
+        for i, col in enumerate(self.coord_columns):
+            if col in other.columns:
+                self.coords[rows, i] = other[col].to_numpy(dtype=np.float64)
+        self.stats["updated"] += len(rows)
+
+    def _report(self, rows, ours, theirs, source, resolution):
+        differing = []
+        label_names = np.array(self.label_columns, dtype=object)
+        for our_row, their_row in zip(ours, theirs):
+            cols = np.flatnonzero((our_row != their_row) & ~(np.isnan(our_row) & np.isnan(their_row)))
+            differing.append(";".join(
+                f"{label_names[i]}:{_fmt(our_row[i])}->{_fmt(their_row[i])}" for i in cols))
+        self.conflicts.append(pd.DataFrame({
+            "Image Name": self.names[rows],
+            "Source": source,
+            "Differences": differing,
+            "Resolution": list(resolution),
+        }))
+        self.stats["conflicts"] += len(rows)
+
+    def result(self):
+        """The merged table, with the base file's column order and dtypes"""
+        df = pd.DataFrame({"Image Name": self.names})
+        for i, col in enumerate(self.coord_columns):
+            df[col] = self.coords[:, i]
+        for i, col in enumerate(self.label_columns):
+            df[col] = self.labels[:, i]
+        df["Signed"] = self.signed
+        df = df[[col for col in self.columns if col in df.columns]]
+        for col, dtype in self.dtypes.items():
+            if col in df and df[col].dtype != dtype and not df[col].isna().any():
+                df[col] = df[col].astype(dtype)
+        if self.new_rows:
+            df = pd.concat([df] + [chunk.reindex(columns=self.columns) for chunk in self.new_rows],
+                           ignore_index=True)
+        return df
+
+    def conflict_report(self):
+        if not self.conflicts:
+            return pd.DataFrame(columns=["Image Name", "Source", "Differences", "Resolution"])
+        return pd.concat(self.conflicts, ignore_index=True)
+
+
+def _fmt(value):
+    return "NaN" if np.isnan(value) else str(int(value)) if float(value).is_integer() else str(value)
+
+
+def merge_files(base_path, other_paths, out_path, policy="signed-wins", report_path=None,
+                chunksize=CHUNK_ROWS, add_new=False):
+    """Merge `other_paths` into `base_path` and write the result to `out_path`"""
+    base_df = pd.read_csv(base_path)
+    merger = LabelMerger(base_df, policy, base_mtime=os.path.getmtime(base_path), add_new=add_new)
+    del base_df
+    for path in other_paths:
+        merger.merge_file(path, chunksize)
+    write_csv_atomically(merger.result(), out_path)
+    if report_path:
+        merger.conflict_report().to_csv(report_path, index=False)
+    return merger.stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge label exports on 'Image Name'.")
+    parser.add_argument("base", help="labels CSV to merge into (e.g. output_cm.csv)")
+    parser.add_argument("others", nargs="+", help="other reviewers' exports")
+    parser.add_argument("-o", "--output", default="combined.csv", help="merged CSV (default: %(default)s)")
+    parser.add_argument("-p", "--policy", choices=POLICIES, default="signed-wins")
+    parser.add_argument("-r", "--report", default="merge_conflicts.csv",
+                        help="conflict report CSV (default: %(default)s)")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_ROWS, help="rows read per chunk")
+    parser.add_argument("--add-new", action="store_true", help="append rows that only exist in the other files")
+    args = parser.parse_args(argv)
+
+    stats = merge_files(args.base, args.others, args.output, args.policy, args.report,
+                        args.chunksize, args.add_new)
+    print(f"Merged {len(args.others)} file(s) into {args.output} ({args.policy}): "
+          f"{stats['matched']} matched, {stats['updated']} updated, "
+          f"{stats['conflicts']} conflicts (see {args.report}), {stats['only_in_other']} only in other files")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
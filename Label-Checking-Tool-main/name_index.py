@@ -0,0 +1,80 @@
+import os
+from bisect import bisect_left
+import numpy as np
+
+
+def base_name_of(img_name):
+    """20240302_095020_0_0_373_346.jpg -> 20240302_095020"""
+    parts = os.path.splitext(os.path.basename(img_name))[0].split('_')
+    if len(parts) >= 5:
+        return '_'.join(parts[:-4])
+    return '_'.join(parts)
+
+
+def _prefix_bounds(keys, prefix):
+    """[lo, hi) of the sorted `keys` that start with `prefix`"""
+    if not prefix:
+        return 0, len(keys)
+    lo = bisect_left(keys, prefix)
+    # Smallest string greater than every string starting with `prefix`
+    hi = bisect_left(keys, prefix[:-1] + chr(ord(prefix[-1]) + 1), lo)
+    return lo, hi
+
+
+class NameIndex:
+    """Sorted index over patch names for prefix and per-base-image lookups.
+
+    Two orderings of the same rows are kept:
+      * by full image name, for "name starts with ..." queries
+      * by (base image, table row), so every base image owns one contiguous range
+    Prefix queries are a binary search over the sorted names (O(log n) plus the
+    size of the result); a base image's rows are a dict lookup of its range.
+    """
+
+    def __init__(self, names, case_sensitive=True):
+        self.case_sensitive = case_sensitive
+        keys = [self._key(name) for name in names]
+
+        self.name_order = np.array(sorted(range(len(keys)), key=keys.__getitem__), dtype=np.int64)
+        self.sorted_names = [keys[i] for i in self.name_order]
+
+        bases = [self._key(base_name_of(name)) for name in names]
+        self.base_order = np.array(sorted(range(len(keys)), key=lambda i: (bases[i], i)), dtype=np.int64)
+        # base name -> [start, end) into base_order
+        self.base_ranges = {}
+        for pos, row in enumerate(self.base_order):
+            base = bases[row]
+            start, _ = self.base_ranges.get(base, (pos, pos))
+            self.base_ranges[base] = (start, pos + 1)
+        self.sorted_bases = sorted(self.base_ranges)
+
+    def _key(self, text):
+        return text if self.case_sensitive else text.lower()
+
+    def prefix_rows(self, prefix):
+        """Table rows whose image name starts with `prefix`, in table order"""
+        lo, hi = _prefix_bounds(self.sorted_names, self._key(prefix))
+        return np.sort(self.name_order[lo:hi])
+
+    def search_rows(self, text):
+        """prefix_rows(), or the rows whose name contains `text` anywhere if none start with it"""
+        rows = self.prefix_rows(text)
+        if len(rows) or not text:
+            return rows
+        # Fallback: a linear scan, only paid when the fast path finds nothing
+        key = self._key(text)
+        hits = [pos for pos, name in enumerate(self.sorted_names) if key in name]
+        return np.sort(self.name_order[hits])
+
+    def base_range(self, base_name):
+        """[start, end) of the base image's patches within base_order"""
+        return self.base_ranges.get(self._key(base_name), (0, 0))
+
+    def rows_of_base(self, base_name):
+        """Table rows of every patch cut from `base_name`, in table order"""
+        start, end = self.base_range(base_name)
+        return self.base_order[start:end]
+
+    def bases_with_prefix(self, prefix):
+        lo, hi = _prefix_bounds(self.sorted_bases, self._key(prefix))
+        return self.sorted_bases[lo:hi]
@@ -0,0 +1,260 @@
+import os
+import sys
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from PIL import Image, ImageOps
+from label_store import META_COLUMNS, LABEL_CSV
+from name_index import base_name_of
+from rotation_registry import get_rotation_registry, ROTATION_XLSX
+from extraction_manifest import ExtractionManifest, file_signature, file_hash, source_record, output_record
+from patch_output import PatchWriter, OUTPUT_FORMATS, mcu_size
+from box_geometry import image_orientation
+
+
+IMG_FOLDER = "imgs"
+OUTPUT_DIR = "patches_img_name_2025_04_25"
+MAX_NAME_LENGTH = 255
+PROGRESS_EVERY = 1.0  # seconds between progress lines
+
+
+def patch_file_name(xtl, ytl, xbr, ybr, labels, extension=".jpg"):
+    """File name of a patch inside its base image's folder (the test.py naming)"""
+    name = f"{int(xtl)}{int(ytl)}{int(xbr)}_{int(ybr)}{extension}"
+    if len(name) > MAX_NAME_LENGTH:
+        name = f"{'-_-'.join(sorted(labels)) if labels else 'unlabeled'}{extension}"
+    if len(name) > MAX_NAME_LENGTH:
+        truncated = f"{hashlib.md5(name.encode()).hexdigest()[:8]}{extension}"
+        logging.warning(f"Filename truncated: {name} -> {truncated}")
+        name = truncated
+    return name
+
+
+class ExtractionJob:
+    """Every patch cut from one base image; the unit of work sent to a worker"""
+
+    def __init__(self, base_name, image_path, rotation, out_folder):
+        self.base_name = base_name
+        self.image_path = image_path
+        self.rotation = rotation
+        self.out_folder = out_folder
+        self.patches = []  # (image name, (xtl, ytl, xbr, ybr), output path)
+        self.copy_path = os.path.join(out_folder, os.path.basename(image_path))
+        # From the manifest: the source as last seen, and the outputs that are
+        # up to date as long as the source has not changed since
+        self.known_source = None
+        self.fresh = set()
+
+    def add(self, img_name, box, out_name):
+        self.patches.append((img_name, box, os.path.join(self.out_folder, out_name)))
+
+    def check_manifest(self, manifest, encoding):
+        """Look up this job's outputs; True if nothing at all needs doing"""
+        self.known_source = manifest.source(self.image_path)
+        if self.known_source is None:
+            return False
+        known_hash = self.known_source["hash"]
+        self.fresh = {out_path for _, box, out_path in self.patches
+                      if manifest.is_fresh(out_path, known_hash, self.rotation, box, encoding)}
+        if manifest.is_fresh(self.copy_path, known_hash, None, None):
+            self.fresh.add(self.copy_path)
+        try:
+            unchanged = file_signature(self.image_path) == self.known_source["sig"]
+        except OSError:
+            return False
+        return unchanged and len(self.fresh) == len(self.patches) + 1
+
+
+def plan(df, img_folder=IMG_FOLDER, out_dir=OUTPUT_DIR, rotations=None, extension=".jpg"):
+    """Group the rows of a labels table into one ExtractionJob per base image"""
+    if rotations is None:
+        rotations = get_rotation_registry()
+    label_columns = [col for col in df.columns if col not in META_COLUMNS]
+    labels = df[label_columns].to_numpy() == 1
+    boxes = df[["xtl", "ytl", "xbr", "ybr"]].to_numpy(dtype=float)
+    jobs = {}
+    for row, img_name in enumerate(df["Image Name"].to_numpy()):
+        base_name = base_name_of(img_name)
+        job = jobs.get(base_name)
+        if job is None:
+            job = ExtractionJob(base_name, os.path.join(img_folder, f"{base_name}.jpg"),
+                                rotations.rotation_for(f"{base_name}.jpg"),
+                                os.path.join(out_dir, base_name))
+            jobs[base_name] = job
+        box = tuple(boxes[row])
+        active = [label_columns[i] for i in labels[row].nonzero()[0]]
+        job.add(img_name, box, patch_file_name(*box, active, extension))
+    return list(jobs.values())
+
+
+def load_for_cropping(image_path, rotation):
+    """Decode a base image once, as stored, with the Orientation that makes it upright.
+
+    Boxes are in upright coordinates; Orientation.crop() maps each one back to
+    the stored frame and turns only the patch, so the full image is never
+    transposed. For a rotation that is not a right angle the image is rotated
+    up front and the orientation is None.
+    """
+    img = Image.open(image_path)
+    orientation = image_orientation(img, rotation)
+    if orientation is None:
+        with img:
+            return ImageOps.exif_transpose(img).rotate(-rotation, expand=True), None
+    img.load()  # also releases the file
+    return img, orientation
+
+
+def crop_upright(img, orientation, box):
+    return img.crop(box) if orientation is None else orientation.crop(img, box)
+
+
+def extract_base(job, writer):
+    """Worker: decode one base image and save those of its patches that are out of date.
+
+    Returns (base name, patches written, patches whose bytes were already on
+    disk, patches skipped, errors as (image name, message), manifest records).
+    """
+    if not os.path.exists(job.image_path):
+        return job.base_name, 0, 0, 0, [(job.base_name, f"Base image not found: {job.image_path}")], []
+    errors = []
+    records = []
+    saved = identical = 0
+    encoding = writer.signature()
+    try:
+        sig = file_signature(job.image_path)
+        known = job.known_source
+        # Only re-hash a base image whose mtime or size moved
+        source_hash = known["hash"] if known and known["sig"] == sig else file_hash(job.image_path)
+        records.append(source_record(job.image_path, sig, source_hash))
+        unchanged = known is not None and known["hash"] == source_hash
+        todo = [patch for patch in job.patches if not (unchanged and patch[2] in job.fresh)]
+
+        os.makedirs(job.out_folder, exist_ok=True)
+        lossless = False
+        if todo and writer.jpegtran:
+            with Image.open(job.image_path) as source:
+                lossless = not job.rotation and writer.can_crop_losslessly(source)
+                mcu = mcu_size(source)
+    except Exception as e:
+        return job.base_name, 0, 0, 0, [(job.base_name, str(e))], []
+
+    img = None
+    for img_name, box, out_path in todo:
+        try:
+            data = writer.crop_losslessly(job.image_path, box, mcu) if lossless else None
+            if data is None:
+                if img is None:
+                    img, orientation = load_for_cropping(job.image_path, job.rotation)
+                data = writer.encode(crop_upright(img, orientation, box))
+            digest, written = writer.write(data, out_path)
+            records.append(output_record(out_path, source_hash, job.rotation, box, digest, encoding))
+            if written:
+                saved += 1
+            else:
+                identical += 1
+        except Exception as e:
+            errors.append((img_name, str(e)))
+    # Keep a copy of the original next to its patches
+    if not (unchanged and job.copy_path in job.fresh):
+        try:
+            shutil.copy(job.image_path, job.copy_path)
+            records.append(output_record(job.copy_path, source_hash, None, None, source_hash))
+        except OSError as e:
+            errors.append((job.base_name, str(e)))
+    return job.base_name, saved, identical, len(job.patches) - len(todo), errors, records
+
+
+def extract_all(df, img_folder=IMG_FOLDER, out_dir=OUTPUT_DIR, rotations=None, workers=None, force=False,
+                writer=None):
+    """Extract the patches in `df` that are missing or out of date, one base image
+    per task across a process pool.
+
+    What was written is kept in <out_dir>/manifest.jsonl; a rerun skips patches
+    whose base image, rotation, box and encoding are unchanged, and an
+    interrupted run picks up after the last base image it finished. `force` redoes everything.
+    `writer` (a PatchWriter, default q95 JPEG) decides how patches are encoded.
+    Prints a progress line (bases, patches, patches/s) about once a second and
+    returns a stats dict.
+    """
+    writer = writer or PatchWriter()
+    jobs = plan(df, img_folder, out_dir, rotations, writer.extension)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = ExtractionManifest(out_dir)
+    stats = {"bases": len(jobs), "patches": 0, "identical": 0, "skipped": 0, "errors": 0, "seconds": 0.0}
+    pending = []
+    for job in jobs:
+        if not force and job.check_manifest(manifest, writer.signature()):
+            stats["skipped"] += len(job.patches)
+        else:
+            pending.append(job)
+    total = sum(len(job.patches) for job in pending)
+    start = last_report = time.time()
+    done_bases = 0
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Biggest bases first so a long one does not finish the run on its own
+            futures = [executor.submit(extract_base, job, writer)
+                       for job in sorted(pending, key=lambda job: len(job.patches), reverse=True)]
+            try:
+                for future in as_completed(futures):
+                    base_name, saved, identical, skipped, errors, records = future.result()
+                    manifest.record(records)
+                    done_bases += 1
+                    stats["patches"] += saved
+                    stats["identical"] += identical
+                    stats["skipped"] += skipped
+                    stats["errors"] += len(errors)
+                    for img_name, message in errors:
+                        logging.error(f"Error processing {img_name}: {message}")
+                    now = time.time()
+                    if now - last_report >= PROGRESS_EVERY or done_bases == len(pending):
+                        last_report = now
+                        done = stats["patches"] + stats["identical"]
+                        rate = done / max(now - start, 1e-6)
+                        print(f"[{done_bases}/{len(pending)} bases] {done}/{total} patches, "
+                              f"{rate:.0f} patches/s, {stats['errors']} errors")
+            except KeyboardInterrupt:
+                print("Interrupted - finished base images are in the manifest, rerun to resume")
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        manifest.close()
+
+    stats["seconds"] = time.time() - start
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cut labelled patches out of the base images.")
+    parser.add_argument("--csv", default=LABEL_CSV, help="labels CSV (default: %(default)s)")
+    parser.add_argument("--imgs", default=IMG_FOLDER, help="base image folder (default: %(default)s)")
+    parser.add_argument("-o", "--out", default=OUTPUT_DIR, help="output folder (default: %(default)s)")
+    parser.add_argument("--rotations", default=ROTATION_XLSX, help="rotation workbook (default: %(default)s)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="re-extract everything, ignoring the manifest")
+    parser.add_argument("--format", choices=sorted(OUTPUT_FORMATS), default="jpeg", help="patch file format")
+    parser.add_argument("-q", "--quality", type=int, default=None, help="JPEG/WebP quality (default: 95/90)")
+    parser.add_argument("--lossless", action="store_true",
+                        help="lossless WebP, or jpegtran crops of MCU-aligned JPEG boxes where possible")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.imgs):
+        print(f"The image folder '{args.imgs}' does not exist.")
+        return 1
+    stats = extract_all(pd.read_csv(args.csv), args.imgs, args.out,
+                        get_rotation_registry(args.rotations), args.workers, args.force,
+                        PatchWriter(args.format, args.quality, args.lossless))
+    print(f"Extracted {stats['patches']} patches from {stats['bases']} base images "
+          f"in {stats['seconds']:.1f}s ({stats['skipped']} up to date, "
+          f"{stats['identical']} unchanged on disk, {stats['errors']} errors)")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(filename='patch_errors_v2.log', level=logging.WARNING)
+    sys.exit(main())
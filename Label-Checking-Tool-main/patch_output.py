@@ -0,0 +1,178 @@
+import io
+import os
+import sys
+import time
+import shutil
+import argparse
+import subprocess
+from PIL import Image
+from extraction_manifest import bytes_hash
+
+
+OUTPUT_FORMATS = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+JPEG_QUALITY = 95
+WEBP_QUALITY = 90
+JPEGTRAN = shutil.which("jpegtran")
+
+
+def mcu_size(img):
+    """(width, height) of a JPEG's minimum coded unit, from its sampling factors"""
+    layers = getattr(img, "layer", None)
+    if not layers:
+        return 8, 8
+    return 8 * max(layer[1] for layer in layers), 8 * max(layer[2] for layer in layers)
+
+
+def pixel_box(box):
+    """The integer box PIL's crop() uses for a float box"""
+    return tuple(int(round(v)) for v in box)
+
+
+class PatchWriter:
+    """Turns a crop into bytes on disk: format, quality, lossless JPEG crops, no-op writes.
+
+      jpeg  fixed-quality JPEG (default q95, 4:4:4); with `lossless`, boxes whose
+            top-left corner sits on an MCU boundary of an upright source JPEG are
+            cut by jpegtran straight from the compressed data, so they are never
+            re-encoded (only when jpegtran is installed)
+      png   lossless, larger files
+      webp  lossy at `quality`, or lossless with `lossless`
+
+    write() leaves a file alone when its bytes are already what would be
+    written, so re-extraction does not touch unchanged patches.
+    """
+
+    def __init__(self, fmt="jpeg", quality=None, lossless=False):
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {fmt!r}, expected one of {', '.join(OUTPUT_FORMATS)}")
+        self.fmt = fmt
+        self.quality = quality if quality is not None else WEBP_QUALITY if fmt == "webp" else JPEG_QUALITY
+        self.lossless = lossless
+        self.jpegtran = JPEGTRAN if fmt == "jpeg" and lossless else None
+
+    @property
+    def extension(self):
+        return OUTPUT_FORMATS[self.fmt]
+
+    def signature(self):
+        """Recorded in the manifest, so changing the settings re-extracts"""
+        if self.fmt == "png":
+            return "png"
+        if self.fmt == "webp":
+            return "webp:lossless" if self.lossless else f"webp:q{self.quality}"
+        return f"jpeg:q{self.quality}" + ("+jpegtran" if self.jpegtran else "")
+
+    def encode(self, patch):
+        buffer = io.BytesIO()
+        if self.fmt == "jpeg":
+            if patch.mode not in ("RGB", "L", "CMYK"):
+                patch = patch.convert("RGB")
+            patch.save(buffer, format="JPEG", quality=self.quality, subsampling=0)
+        elif self.fmt == "webp":
+            patch.save(buffer, format="WEBP", quality=self.quality, lossless=self.lossless, method=4)
+        else:
+            patch.save(buffer, format="PNG", compress_level=1)
+        return buffer.getvalue()
+
+    def can_crop_losslessly(self, source):
+        """True if crops of `source` (an open PIL image) may go through jpegtran.
+
+        Only sources that need no EXIF or manual rotation qualify: the box is in
+        upright coordinates, which are then the stored ones.
+        """
+        return (self.jpegtran is not None and source.format == "JPEG"
+                and source.getexif().get(0x0112, 1) == 1)
+
+    def crop_losslessly(self, source_path, box, mcu):
+        """jpegtran crop of `box` if its top-left corner is MCU aligned, else None"""
+        x0, y0, x1, y1 = pixel_box(box)
+        if x0 % mcu[0] or y0 % mcu[1] or x1 <= x0 or y1 <= y0:
+            return None
+        result = subprocess.run(
+            [self.jpegtran, "-copy", "none", "-crop", f"{x1 - x0}x{y1 - y0}+{x0}+{y0}", source_path],
+            capture_output=True)
+        if result.returncode != 0 or not result.stdout:
+            return None
+        return result.stdout
+
+    def write(self, data, out_path):
+        """Write `data` unless the file already holds exactly these bytes.
+
+        Returns (hash of the bytes, whether the file was written).
+        """
+        digest = bytes_hash(data)
+        try:
+            if os.path.getsize(out_path) == len(data):
+                with open(out_path, "rb") as f:
+                    if f.read() == data:
+                        return digest, False
+        except OSError:
+            pass
+        tmp_path = out_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, out_path)
+        return digest, True
+
+
+def benchmark(image_path, patch_size=256, count=200):
+    """Encode `count` crops of `image_path` with every writer setting and print throughput"""
+    lossless_writer = PatchWriter("jpeg", lossless=True)
+    with Image.open(image_path) as source:
+        source.load()
+        mcu = mcu_size(source)
+        lossless = lossless_writer.can_crop_losslessly(source)
+        img = source.convert("RGB")
+    boxes = []
+    step = max(mcu[0], 16)
+    for i in range(count):
+        x = (i * step * 7) % max(img.width - patch_size, 1)
+        y = (i * step * 3) % max(img.height - patch_size, 1)
+        x, y = x - x % mcu[0], y - y % mcu[1]
+        boxes.append((x, y, x + patch_size, y + patch_size))
+    crops = [img.crop(box) for box in boxes]
+
+    writers = [("PIL default (q75)", None)]
+    writers += [(f"jpeg q{q}", PatchWriter("jpeg", q)) for q in (75, 90, 95)]
+    writers += [("png", PatchWriter("png")), ("webp q90", PatchWriter("webp")),
+                ("webp lossless", PatchWriter("webp", lossless=True))]
+    if lossless:
+        writers.append(("jpegtran lossless crop", lossless_writer))
+
+    print(f"{count} crops of {patch_size}x{patch_size} from {image_path}")
+    for name, writer in writers:
+        start = time.perf_counter()
+        total = fallbacks = 0
+        for box, crop in zip(boxes, crops):
+            if writer is None:
+                buffer = io.BytesIO()
+                crop.save(buffer, format="JPEG")
+                data = buffer.getvalue()
+            else:
+                data = writer.crop_losslessly(image_path, box, mcu) if writer.jpegtran else None
+                if data is None:
+                    # Re-encoded, as extraction does when jpegtran cannot crop a box
+                    fallbacks += writer.jpegtran is not None
+                    data = writer.encode(crop)
+            total += len(data)
+        seconds = time.perf_counter() - start
+        print(f"  {name:24s} {count / seconds:8.0f} patches/s  {total / count / 1024:7.1f} KiB/patch"
+              + (f"  ({fallbacks} re-encoded)" if fallbacks else ""))
+    if not JPEGTRAN:
+        print("  (jpegtran not found - lossless JPEG crops unavailable)")
+    elif not lossless:
+        print("  (not a plain JPEG - lossless JPEG crops unavailable)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark patch encoding settings.")
+    parser.add_argument("image", help="a base image to crop patches from")
+    parser.add_argument("--size", type=int, default=256, help="patch edge in pixels")
+    parser.add_argument("-n", "--count", type=int, default=200, help="patches per setting")
+    args = parser.parse_args(argv)
+    benchmark(args.image, args.size, args.count)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import os
+import pickle
+import pandas as pd
+
+
+ROTATION_XLSX = "strawberry_rotation.xlsx"
+
+
+class RotationRegistry:
+    """image_name -> manual rotation (degrees), parsed from the rotation workbook once.
+
+    Parsing the xlsx takes far longer than opening an image, so the parsed table
+    is pickled next to it (<xlsx>.pkl) and reused until the workbook's mtime or
+    size changes. Lookups are a dict get.
+    """
+
+    def __init__(self, xlsx_path=ROTATION_XLSX):
+        self.xlsx_path = xlsx_path
+        self.cache_path = xlsx_path + ".pkl"
+        self.signature = None
+        self.rotations = {}
+        self.by_stem = {}
+        self.reload_if_changed()
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.xlsx_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload_if_changed(self):
+        """Re-read the workbook (or its pickle) if it changed since the last load"""
+        signature = self._signature()
+        if signature == self.signature:
+            return
+        self.signature = signature
+        if signature is None:
+            self.rotations = {}
+        else:
+            self.rotations = self._load_cached(signature)
+            if self.rotations is None:
+                self.rotations = self._parse_xlsx()
+                self._save_cache(signature)
+        # "20240302_095020" -> rotation, for callers that only know the base name
+        self.by_stem = {os.path.splitext(name)[0]: angle for name, angle in self.rotations.items()}
+
+    def _load_cached(self, signature):
+        try:
+            with open(self.cache_path, "rb") as f:
+                cached = pickle.load(f)
+            if cached.get("signature") == signature:
+                return cached["rotations"]
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError, AttributeError):
+            pass
+        return None
+
+    def _save_cache(self, signature):
+        tmp_path = self.cache_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"signature": signature, "rotations": self.rotations}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Could not write rotation cache {self.cache_path}: {e}")
+
+    def _parse_xlsx(self):
+        print(f"Parsing {self.xlsx_path}")
+        rot_df = pd.read_excel(self.xlsx_path)
+        if 'image_name' not in rot_df.columns or 'rotation' not in rot_df.columns:
+            print(f"{self.xlsx_path} has no image_name/rotation columns; assuming no rotation")
+            return {}
+        rot_df = rot_df.dropna(subset=['image_name', 'rotation'])
+        # First row wins, as with the old rot_df.loc[...].values[0] lookups
+        rot_df = rot_df.drop_duplicates(subset='image_name', keep='first')
+        return {str(name): int(angle) for name, angle in zip(rot_df['image_name'], rot_df['rotation'])}
+
+    def rotation_for(self, image_name, default=0):
+        """Rotation for "name.jpg", a path to it, or just the base name"""
+        name = os.path.basename(image_name)
+        angle = self.rotations.get(name)
+        if angle is None:
+            angle = self.by_stem.get(os.path.splitext(name)[0], default)
+        return angle
+
+    def __contains__(self, image_name):
+        name = os.path.basename(image_name)
+        return name in self.rotations or os.path.splitext(name)[0] in self.by_stem
+
+
+_registries = {}
+
+
+def get_rotation_registry(xlsx_path=ROTATION_XLSX):
+    """Shared registry per workbook; picks up edits to the workbook on each call"""
+    registry = _registries.get(xlsx_path)
+    if registry is None:
+        registry = _registries[xlsx_path] = RotationRegistry(xlsx_path)
+    else:
+        registry.reload_if_changed()
+    return registry
@@ -1,7 +1,8 @@
-import pandas as pd
+from label_store import LabelStore
+from sign_off import sign_off
 
-# Load CSV
-df = pd.read_csv('output_cm.csv')
+# Load CSV plus any edits still in its journal (edits go to a copy, output_cm.csv is only read)
+store = LabelStore('output_cm.csv', read_only=True)
 
 # List of base image names you want to mark as signed
 images_to_sign = ["nihal_ooty_tnau_real_20230912_00047",
@@ -26,15 +27,12 @@ images_to_sign = ["nihal_ooty_tnau_real_20230912_00047",
 "nihal_ooty_tnau_real_20230912_00066",
 "nihal_ooty_tnau_real_20230912_00067"]  # <-- replace with your actual list
 
-# Loop through each row
-for i in range(len(df)):
-    image_name = df.loc[i, 'Image Name']
-    for base_name in images_to_sign:
-        if image_name.startswith(base_name):
-            df.loc[i, 'Signed'] = 1
-            break  # No need to check other base names if one matches
+# Resolved through the sorted name index and written in one vectorized update
+signed_names, unmatched = sign_off(store, images_to_sign)
+for base_name in unmatched:
+    print(f"No patches found for {base_name}")
 
 # Save the updated CSV
-df.to_csv('updated_file_1.csv', index=False)
+store.export_csv('updated_file_1.csv')
 
-print("Updated 'Signed' column for specified images and saved as 'updated_file.csv'")
+print(f"Updated 'Signed' column for {len(signed_names)} patches and saved as 'updated_file_1.csv'")
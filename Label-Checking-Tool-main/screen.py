@@ -1,5 +1,6 @@
 import sys
 import os
+import numpy as np
 import pandas as pd 
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QFrame, QVBoxLayout, QSplitter,
@@ -8,7 +9,6 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import QStringListModel
 from PyQt5.QtWidgets import QCompleter
 from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap
 from change_frame import ChangeFrame
 from image_panel import ImagePanel
 from image_buttons import ImageGrid
@@ -19,6 +19,8 @@ from key_value_selector import AtomicKeyValueSelector
 from PyQt5.QtWidgets import QLabel
 from PyQt5.QtGui import QTextDocument
 from SignedHighlightDelegate import SignedHighlightDelegate
+from label_store import get_store
+from image_loading import get_prefetcher
 
 class MainWindow(QWidget):
     def __init__(self):
@@ -34,6 +36,10 @@ class MainWindow(QWidget):
         """)
         self.buttons_df = pd.read_csv("buttons.csv")
         self.image_names_df = pd.read_csv("img_names.csv")  # Read once and store
+        self.store = get_store()  # output_cm.csv, loaded once and shared by all widgets
+        self.store.start_auto_compaction()
+        self.prefetcher = get_prefetcher()
+        self.last_selected_index = -1
         self.init_ui()
         
     def init_ui(self):  
@@ -50,7 +56,6 @@ class MainWindow(QWidget):
 
         self.imggrid = ImageGrid("20240302_095020_0_0_373_346.jpg")
         image_viewer = QFrame()
-        self.output_df = pd.read_csv("output_cm.csv")
         self.search_bar = QLineEdit()
         self.search_bar.setPlaceholderText("Type image name here")
         
@@ -94,8 +99,7 @@ class MainWindow(QWidget):
             print("deselect_images called")
             self.imggrid.primary_selection = None
             self.imggrid.secondary_selection = set()
-            for btn in self.imggrid.buttons:
-                self.imggrid.update_button_style(btn)
+            self.imggrid.refresh()
 
 
         def multi_change():
@@ -106,32 +110,22 @@ class MainWindow(QWidget):
             if not self.imggrid.secondary_selection:
                 QMessageBox.warning(self, "Warning", "No target images selected (red highlight)")
                 return
-            self.delegate.output_df = pd.read_csv("output_cm.csv")  
             try:
-                df = pd.read_csv("output_cm.csv")
                 source_img = self.imggrid.primary_selection
                 
-                # Get all labels from source image
-                source_row = df[df["Image Name"] == source_img].iloc[0]
-                labels_to_copy = {col: val for col, val in source_row.items() 
-                                if col != "Image Name" and col != "Signed"}
-                
-                # Apply to all target images
-                for target_img in self.imggrid.secondary_selection:
-                    for col, val in labels_to_copy.items():
-                        df.loc[df["Image Name"] == target_img, col] = val
-                    df.loc[df["Image Name"] == target_img, "Signed"] = 1  # Mark as signed
-                    
-                # Save changes
-                df.to_csv("output_cm.csv", index=False)
-                
-                QMessageBox.information(self, "Success", 
-                    f"Copied labels from {source_img} to {len(self.imggrid.secondary_selection)} images")
+                # Copy the whole label vector and sign off in one vectorized,
+                # journaled write (compacted in the background)
+                skipped = self.store.copy_labels(source_img, self.imggrid.secondary_selection)
+                copied = len(self.imggrid.secondary_selection) - len(skipped)
+                message = f"Copied labels from {source_img} to {copied} images"
+                if skipped:
+                    message += f" ({len(skipped)} not found in the labels CSV were skipped)"
+                QMessageBox.information(self, "Success", message)
                 
                 # Clear selections after operation
                 self.imggrid.primary_selection = None
                 self.imggrid.secondary_selection = set()
-                self.imggrid.load_images()  # Refresh button highlights
+                self.imggrid.refresh()  # Clear the selection borders
                 
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"Failed to copy labels: {str(e)}")
@@ -139,19 +133,16 @@ class MainWindow(QWidget):
        
         def search_images():
             
-            if  self.imggrid.thread_running:
-                QMessageBox.warning(self, "Warning", "Image loading is still in progress")
-                return
-            
             img_name = self.search_bar.text().strip()
             img_labels = self.drop_down.get_selected_items()
-            df = pd.read_csv("output_cm.csv")
-            all_label_columns = [col for col in df.columns if col not in ['Image Name', 'Signed','xtl', 'ytl', 'xbr', 'ybr']]
+            df = self.store.df
+            # Label combinations are answered from per-label bitsets, not df.query
+            index = self.store.bitmap_index()
 
             # CASE 1: Only image name provided
             if img_name and not img_labels:
-                filtered_df = df[df["Image Name"].str.contains(img_name)]
-                all_imgs = filtered_df["Image Name"].tolist()
+                # Prefix range from the sorted name index; substring scan only if that is empty
+                rows = self.store.name_index().search_rows(img_name)
                 # Then modify the line to:
                 try:
                     self.current_base_index = self.image_names_df["Image Name"].tolist().index(img_name)
@@ -162,26 +153,19 @@ class MainWindow(QWidget):
 
             # CASE 2: Only labels provided
             elif not img_name and img_labels:
-                positive_labels = set(img_labels)
-                negative_labels = set(all_label_columns) - positive_labels
-                query = " & ".join(
-                    [f"(`{label}` == 1)" for label in positive_labels] +
-                    [f"(`{label}` == 0)" for label in negative_labels]
-                )
-                filtered_df = df.query(query)
-                all_imgs = filtered_df.sort_values('Signed', ascending=False)["Image Name"].tolist()
+                # Exactly the selected labels: all positives set, every other label 0 (not empty)
+                matches = index.exact(img_labels, self.store.label_columns)
+                # Signed patches first
+                signed = index.bitmap("Signed")
+                rows = np.concatenate([index.rows(matches & signed), index.rows(matches & ~signed)])
 
             # CASE 3: Both image name and labels provided
             elif img_name and img_labels:
-                name_filtered = df[df["Image Name"].str.contains(img_name)]
-                positive_labels = set(img_labels)
-                negative_labels = set(all_label_columns) - positive_labels
-                query = " & ".join(
-                    [f"(`{label}` == 1)" for label in positive_labels] +
-                    [f"(`{label}` == 0)" for label in negative_labels]
-                )
-                label_filtered = df.query(query)
-                all_imgs = [img for img in name_filtered["Image Name"] if img in label_filtered["Image Name"].values]
+                name_mask = np.zeros(len(df), dtype=bool)
+                name_mask[self.store.name_index().search_rows(img_name)] = True
+                name_filtered = index.from_mask(name_mask)
+                label_filtered = index.exact(img_labels, self.store.label_columns)
+                rows = index.rows(name_filtered & label_filtered)
                 try:
                     self.current_base_index = self.image_names_df["Image Name"].tolist().index(img_name)
                 except ValueError:
@@ -190,13 +174,12 @@ class MainWindow(QWidget):
 
             # CASE 4: Nothing provided
             else:
-                all_imgs = df["Image Name"].tolist()
+                rows = np.arange(len(df))
+            all_imgs = self.store.names_at(rows)
             
-            # Optimized signed fraction calculation
+            # Signed fraction straight from the matching rows
             if len(all_imgs) > 0:
-                # Use pandas isin() for fast filtering
-                signed_df = df[df["Image Name"].isin(all_imgs)]
-                signed_count = signed_df["Signed"].sum()  # Fast sum of 1s
+                signed_count = df["Signed"].to_numpy()[rows].sum()
                 total_count = len(all_imgs)
                 self.number_signed_status_label.setText(f"Fraction: {int(signed_count)}/{total_count}")
             else:
@@ -204,8 +187,7 @@ class MainWindow(QWidget):
             self.number_signed_status_label.setStyleSheet("color: white;")
 
             # Update image grid
-            self.imggrid.images = all_imgs
-            self.imggrid.load_images()
+            self.show_grid_images(all_imgs)
 
         self.search_btn.clicked.connect(search_images)
         self.confirm_btn.clicked.connect(multi_change)
@@ -279,82 +261,85 @@ class MainWindow(QWidget):
         self.image_frame.layout().addWidget(splitter_image_frame)
 
     def jump_to_start(self):
-        if  self.imggrid.thread_running:
-            QMessageBox.warning(self, "Warning", "Image loading is still in progress")
-            return
-        
         if len(self.img_names) > 0:
             self.current_base_index = 0
             base_img = self.img_names.iloc[0]['Image Name']
-            arr = [img for img in self.output_df['Image Name'] if base_img in img]
-            self.imggrid.images = arr
+            arr = self.store.patches_of(base_img)
+            self.show_grid_images(arr)
             self.search_bar.setText(base_img)
 
-            self.imggrid.load_images()
+            self.prefetch_neighbours(direction=1)
 
     def jump_back(self):
-        if  self.imggrid.thread_running:
-            QMessageBox.warning(self, "Warning", "Image loading is still in progress")
-            return
-        
         if len(self.img_names) > 0:
             self.current_base_index = max(0, self.current_base_index - 10)
             base_img = self.img_names.iloc[self.current_base_index]['Image Name']
-            arr = [img for img in self.output_df['Image Name'] if base_img in img]
-            self.imggrid.images = arr
+            arr = self.store.patches_of(base_img)
+            self.show_grid_images(arr)
             self.search_bar.setText(base_img)
-            self.imggrid.load_images()
+            self.prefetch_neighbours(direction=-1)
 
     def previous_image(self):
-        if  self.imggrid.thread_running:
-            QMessageBox.warning(self, "Warning", "Image loading is still in progress")
-            return
-        
         if len(self.img_names) > 0 and self.current_base_index > 0:
             self.current_base_index -= 1
             base_img = self.img_names.iloc[self.current_base_index]['Image Name']
-            arr = [img for img in self.output_df['Image Name'] if base_img in img]
-            self.imggrid.images = arr
+            arr = self.store.patches_of(base_img)
+            self.show_grid_images(arr)
             self.search_bar.setText(base_img)
-            self.imggrid.load_images()
+            self.prefetch_neighbours(direction=-1)
 
     def next_image(self):
-        if  self.imggrid.thread_running:
-            QMessageBox.warning(self, "Warning", "Image loading is still in progress")
-            return
-        
 
         if len(self.img_names) > 0 and self.current_base_index < len(self.img_names) - 1:
             self.current_base_index += 1
             print("0")
             base_img = self.img_names.iloc[self.current_base_index]['Image Name']
             print("1")
-            arr = [img for img in self.output_df['Image Name'] if base_img in img]
+            arr = self.store.patches_of(base_img)
             print("2")
-            self.imggrid.images = arr
+            self.show_grid_images(arr)
             print("3")
             self.search_bar.setText(base_img)
             print("4")
-            self.imggrid.load_images()
+            self.prefetch_neighbours(direction=1)
             print("5")
 
     def jump_forward(self):
         if len(self.img_names) > 0:
             self.current_base_index = min(len(self.img_names) - 1, self.current_base_index + 10)
             base_img = self.img_names.iloc[self.current_base_index]['Image Name']
-            arr = [img for img in self.output_df['Image Name'] if base_img in img]
-            self.imggrid.images = arr
+            arr = self.store.patches_of(base_img)
+            self.show_grid_images(arr)
             self.search_bar.setText(base_img)
-            self.imggrid.load_images()
+            self.prefetch_neighbours(direction=1)
 
     def jump_to_end(self):
         if len(self.img_names) > 0:
             self.current_base_index = len(self.img_names) - 1
             base_img = self.img_names.iloc[-1]['Image Name']
-            arr = [img for img in self.output_df['Image Name'] if base_img in img]
-            self.imggrid.images = arr
+            arr = self.store.patches_of(base_img)
+            self.show_grid_images(arr)
             self.search_bar.setText(base_img)
-            self.imggrid.load_images()
+            self.prefetch_neighbours(direction=-1)
+
+    def show_grid_images(self, images):
+        """Replace the grid's patch list (selection history refers to the old list)"""
+        self.imggrid.images = images
+        self.last_selected_index = -1
+        self.imggrid.load_images()
+
+    def prefetch_neighbours(self, img=None, direction=None):
+        """Decode the patches after (or before) `img` and its base image in the background.
+
+        Without `img` (a new patch list, nothing selected yet) the caller passes
+        the direction it navigated in; otherwise it follows the selection.
+        """
+        names = self.imggrid.images
+        index = self.imggrid.model.row_of.get(img, -1)
+        if direction is None:
+            direction = 1 if index >= self.last_selected_index else -1
+        self.last_selected_index = index
+        self.prefetcher.prefetch_around(names, index, direction)
 
     def handle_image_selection(self, img):
         print("handle_image_selection called ")
@@ -364,8 +349,10 @@ class MainWindow(QWidget):
             if not os.path.exists(image_path):
                 raise FileNotFoundError(f"Image not found at: {image_path}")
             
+            # Usually already decoded by the prefetcher on a previous step
             self.image_panel.filename = img
-            self.image_panel.set_image(QPixmap(image_path))
+            self.image_panel.set_image(self.prefetcher.patch(image_path))
+            self.prefetch_neighbours(img)
             
             # Update signed status
             signed_status = self.get_signed_status(img)
@@ -417,13 +404,9 @@ class MainWindow(QWidget):
 
 
     def get_signed_status(self, img_name):
-        """Check if image is signed in the output CSV"""
+        """Check if image is signed in the label store"""
         try:
-            df = pd.read_csv("output_cm.csv")
-            img_row = df[df["Image Name"] == img_name]
-            if not img_row.empty:
-                return bool(img_row.iloc[0]["Signed"])
-            return False
+            return self.store.is_signed(img_name)
         except Exception as e:
             print(f"Error checking signed status: {str(e)}")
             return False
@@ -663,20 +646,11 @@ class MainWindow(QWidget):
     def get_current_labels(self, img):
         print("get_current_labels called ")
         """Helper to get current labels for an image"""
-        labels_df = pd.read_csv("output_cm.csv")
-        img_row = labels_df[labels_df["Image Name"] == img]
-        
-        if img_row.empty:
-            return []
-            
-        img_row = img_row.iloc[0]
         current_labels = []
         label_to_short = dict(zip(self.buttons_df["xml_labels"], self.buttons_df["short_forms"]))
         
-        for label, value in img_row.items():
-            if label == "Image Name":
-                continue
-            if value == 1 and label in label_to_short:
+        for label in self.store.active_labels(img):
+            if label in label_to_short:
                 current_labels.append(label_to_short[label])
                 
         return current_labels
@@ -697,30 +671,29 @@ class MainWindow(QWidget):
             return
 
         try:
-            df = pd.read_csv("output_cm.csv")
             short_to_full = dict(zip(self.buttons_df["short_forms"], self.buttons_df["xml_labels"]))
             full_to_short = dict(zip(self.buttons_df["xml_labels"], self.buttons_df["short_forms"]))
 
-            row_idx = df[df["Image Name"] == image_name].index
-            if row_idx.empty:
+            if image_name not in self.store:
                 QMessageBox.warning(self, "Warning", f"Image {image_name} not found in CSV")
                 return
-            row_idx = row_idx[0]
+            columns = self.store.df.columns
+            updates = {}
 
             print("Processing additions:", self.label_frame_add.selected_buttons)
             # Process additions
             for short_label in self.label_frame_add.selected_buttons:
                 full_label = short_to_full.get(short_label)
-                if full_label in df.columns:
-                    df.at[row_idx, full_label] = 1
+                if full_label in columns:
+                    updates[full_label] = 1
             self.label_frame_add.selected_buttons.clear()  # Clear after processing
 
             print("Processing deletions:", self.label_frame_delete.selected_buttons)
             # Process deletions
             for short_label in self.label_frame_delete.selected_buttons:
                 full_label = short_to_full.get(short_label)
-                if full_label in df.columns:
-                    df.at[row_idx, full_label] = 0
+                if full_label in columns:
+                    updates[full_label] = 0
             
             self.label_frame_delete.selected_buttons.clear()  # Clear after processing
 
@@ -731,32 +704,19 @@ class MainWindow(QWidget):
                 current_full = short_to_full.get(current_short)
                 new_full = short_to_full.get(new_short)
                 
-                if current_full in df.columns and new_full in df.columns:
-                    df.at[row_idx, current_full] = 0
-                    df.at[row_idx, new_full] = 1
+                if current_full in columns and new_full in columns:
+                    updates[current_full] = 0
+                    updates[new_full] = 1
             
-            df.at[row_idx, "Signed"] = 1
-            df.to_csv("output_cm.csv", index=False)
+            updates["Signed"] = 1
+            # Journaled append; the CSV is rewritten by background compaction
+            self.store.set_values(image_name, updates)  # Grid tooltips refresh via the store
             
             # Clear mappings
             self.label_frame_change.color_mapping.clear()
             self.label_frame_change.reverse_mapping.clear()
             self.label_frame_change.selected_current_label = None
             
-            # Update tooltip for the image button
-            for btn in self.imggrid.buttons:
-                if btn.property("img_file") == image_name:
-                    # Get all active labels (columns with value 1)
-                    img_row = df[df["Image Name"] == image_name].iloc[0]
-                    label_cols = [col for col in df.columns 
-                                if col not in ['Image Name', 'Signed', 'xtl', 'ytl', 'xbr', 'ybr']]
-                    active_labels = [col for col in label_cols if img_row[col] == 1]
-                    
-                    # Set tooltip with filename and active labels
-                    tooltip = f"{image_name}\nLabels: {', '.join(active_labels)}" if active_labels else image_name
-                    btn.setToolTip(tooltip)
-                    break
-            self.delegate.output_df = pd.read_csv("output_cm.csv")  # Update delegate's cached DataFrame
             signed_status = self.get_signed_status(image_name)
             self.signed_status_label.setText(f"Signed: {'Yes' if signed_status else 'No'}")
         except Exception as e:
@@ -764,6 +724,16 @@ class MainWindow(QWidget):
             print(f"Error saving changes: {str(e)}")
 
 
+    def closeEvent(self, event):
+        """Fold any journaled edits into output_cm.csv before exiting"""
+        try:
+            self.imggrid.cleanup()
+            self.prefetcher.shutdown()
+            self.store.close()
+        except Exception as e:
+            print(f"Error saving labels on exit: {str(e)}")
+        super().closeEvent(event)
+
     def setup_main_layout(self):
         """Setup the main window layout"""
         scroll_area = QScrollArea()
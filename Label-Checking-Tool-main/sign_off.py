@@ -0,0 +1,109 @@
+import os
+import sys
+import argparse
+from fnmatch import fnmatchcase
+import numpy as np
+import pandas as pd
+from label_store import LabelStore, LABEL_CSV
+from file_lock import LockHeldError
+
+
+GLOB_CHARS = "*?["
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def read_names(path):
+    """Names from a file: the "Image Name" (or first) column of a CSV, else one per line"""
+    if path.lower().endswith(".csv"):
+        df = pd.read_csv(path)
+        column = "Image Name" if "Image Name" in df.columns else df.columns[0]
+        return [str(name) for name in df[column].dropna()]
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def resolve(store, patterns):
+    """Table rows matched by base names, patch names or globs, plus the patterns that matched nothing.
+
+    * a glob ("2024030*_0_0_*") is narrowed to its literal prefix through the
+      sorted name index and only those candidates are fnmatch'ed
+    * an exact patch name is a dict lookup
+    * a base image name (with or without extension) is its contiguous range in
+      the name index
+    * anything else is treated as a name prefix, as rough.py used to do
+    """
+    index = store.name_index()
+    names = store.df["Image Name"].to_numpy()
+    matched = []
+    unmatched = []
+    for pattern in patterns:
+        pattern = pattern.strip()
+        if not pattern:
+            continue
+        wildcard = min((pattern.find(c) for c in GLOB_CHARS if c in pattern), default=-1)
+        if wildcard >= 0:
+            candidates = index.prefix_rows(pattern[:wildcard])
+            rows = candidates[[fnmatchcase(name, pattern) for name in names[candidates]]]
+        elif pattern in store.row_of:
+            rows = np.array([store.row_of[pattern]], dtype=np.int64)
+        else:
+            base = os.path.splitext(pattern)[0] if pattern.lower().endswith(IMAGE_EXTENSIONS) else pattern
+            rows = index.rows_of_base(base)
+            if not len(rows):
+                rows = index.prefix_rows(pattern)
+        if len(rows):
+            matched.append(rows)
+        else:
+            unmatched.append(pattern)
+    rows = np.unique(np.concatenate(matched)) if matched else np.array([], dtype=np.int64)
+    return rows, unmatched
+
+
+def sign_off(store, patterns, signed=1, dry_run=False):
+    """Mark every patch matched by `patterns` as signed (or unsigned) in one journaled write.
+
+    Returns (names of matched patches, patterns that matched nothing).
+    """
+    rows, unmatched = resolve(store, patterns)
+    img_names = store.names_at(rows)
+    if img_names and not dry_run:
+        store.set_values_many(img_names, {"Signed": signed})
+    return img_names, unmatched
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mark patches in output_cm.csv as signed off.")
+    parser.add_argument("names", nargs="*", help="base image names, patch names or globs")
+    parser.add_argument("-f", "--file", action="append", default=[],
+                        help="file of names (one per line, or a CSV with an 'Image Name' column)")
+    parser.add_argument("--csv", default=LABEL_CSV, help="label CSV (default: %(default)s)")
+    parser.add_argument("--unsign", action="store_true", help="clear Signed instead of setting it")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="only report what would change")
+    args = parser.parse_args(argv)
+
+    patterns = list(args.names)
+    for path in args.file:
+        patterns.extend(read_names(path))
+    if not patterns:
+        parser.error("no names given")
+
+    try:
+        # A dry run only reads: no writer lock, nothing compacted or saved
+        store = LabelStore(args.csv, read_only=args.dry_run)
+    except LockHeldError as e:
+        print(e)
+        return 2
+    try:
+        img_names, unmatched = sign_off(store, patterns, 0 if args.unsign else 1, args.dry_run)
+    finally:
+        # Folds the journaled edit into the CSV (under the compaction lock)
+        store.close()
+    for pattern in unmatched:
+        print(f"No patches match: {pattern}")
+    action = "Would mark" if args.dry_run else "Marked"
+    print(f"{action} {len(img_names)} patches as {'unsigned' if args.unsign else 'signed'} in {args.csv}")
+    return 0 if img_names else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+import numpy as np
+from name_index import base_name_of
+
+
+class SignOffAggregates:
+    """Per-base-image (total patches, signed patches), kept current on every edit.
+
+    Built once from a NameIndex's base ranges; afterwards a Signed flip is a
+    single dict update, and a batch of flips one bincount over the changed
+    rows, instead of a rescan of the whole table.
+    """
+
+    def __init__(self, name_index, signed):
+        self.case_sensitive = name_index.case_sensitive
+        signed = (np.asarray(signed) == 1).astype(np.int64)
+        bases = list(name_index.base_ranges)
+        starts = np.array([name_index.base_ranges[base][0] for base in bases], dtype=np.int64)
+        # Base ranges are contiguous in base_order, so one reduceat sums them all
+        sums = np.add.reduceat(signed[name_index.base_order], starts) if len(starts) else []
+        self.counts = {}
+        self.bases = bases
+        self.base_of_row = np.zeros(len(name_index.base_order), dtype=np.int64)  # table row -> index into bases
+        for code, (base, total_signed) in enumerate(zip(bases, sums)):
+            start, end = name_index.base_ranges[base]
+            self.counts[base] = [end - start, int(total_signed)]
+            self.base_of_row[name_index.base_order[start:end]] = code
+
+    def _key(self, base_name):
+        return base_name if self.case_sensitive else base_name.lower()
+
+    def progress(self, base_name):
+        """(signed, total) for a base image; (0, 0) if it has no patches"""
+        total, signed = self.counts.get(self._key(base_name), (0, 0))
+        return signed, total
+
+    def is_fully_signed(self, base_name):
+        signed, total = self.progress(base_name)
+        return total > 0 and signed == total
+
+    def signed_changed(self, img_name, old, new):
+        """Apply one patch's Signed flip to its base image's counts"""
+        was_signed, now_signed = old == 1, new == 1
+        if was_signed == now_signed:
+            return
+        counts = self.counts.get(self._key(base_name_of(img_name)))
+        if counts is not None:
+            counts[1] += 1 if now_signed else -1
+
+    def signed_changed_many(self, rows, old_values, new):
+        """Apply Signed flips of many table rows (old values per row, one new value)"""
+        if not len(rows) or not self.bases:
+            return
+        was_signed = np.asarray(old_values, dtype=np.float64) == 1
+        delta = (1 if new == 1 else 0) - was_signed.astype(np.int64)
+        changed = delta != 0
+        per_base = np.bincount(self.base_of_row[np.asarray(rows)[changed]], weights=delta[changed],
+                               minlength=len(self.bases))
+        for code in np.flatnonzero(per_base):
+            self.counts[self.bases[code]][1] += int(per_base[code])
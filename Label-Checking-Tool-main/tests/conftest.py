@@ -0,0 +1,30 @@
+import os
+import sys
+import pandas as pd
+import pytest
+
+# The tool's modules live next to this folder, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def write_labels(path, rows):
+    """Write a small output_cm.csv-style table: (image name, signed, {label: value})"""
+    labels = sorted({label for _, _, values in rows for label in values})
+    records = []
+    for name, signed, values in rows:
+        record = {"Image Name": name, "Signed": signed, "xtl": 0, "ytl": 0, "xbr": 10, "ybr": 10}
+        record.update({label: values.get(label, 0) for label in labels})
+        records.append(record)
+    pd.DataFrame(records).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture
+def labels_csv(tmp_path):
+    return write_labels(tmp_path / "output_cm.csv", [
+        ("fieldA_20230912_00001_0_0_10_10.jpg", 0, {"rust": 1, "blight": 0}),
+        ("fieldA_20230912_00001_10_0_20_10.jpg", 0, {"rust": 0, "blight": 1}),
+        ("fieldA_20230912_00002_0_0_10_10.jpg", 1, {"rust": 1, "blight": 1}),
+        ("fieldB_20240302_00003_0_0_10_10.jpg", 0, {"rust": 0, "blight": 0}),
+        ("fieldB_20240302_00003_10_0_20_10.jpg", 1, {"rust": 0, "blight": 1}),
+    ])
@@ -0,0 +1,86 @@
+import os
+import json
+import pandas as pd
+import pytest
+from PIL import Image
+from patch_extractor import extract_all
+from extraction_manifest import MANIFEST_NAME
+
+BASES = ["fieldA_20230912_00001", "fieldB_20240302_00003"]
+BOXES = [(0, 0, 16, 16), (16, 0, 32, 16), (0, 16, 16, 32)]
+
+
+class NoRotations:
+    def rotation_for(self, name):
+        return 0
+
+
+@pytest.fixture
+def job(tmp_path):
+    img_folder = tmp_path / "imgs"
+    img_folder.mkdir()
+    rows = []
+    for i, base in enumerate(BASES):
+        Image.new("RGB", (64, 48), (40 * i, 120, 200)).save(img_folder / f"{base}.jpg")
+        for xtl, ytl, xbr, ybr in BOXES:
+            rows.append({"Image Name": f"{base}_{xtl}_{ytl}_{xbr}_{ybr}.jpg", "Signed": 1,
+                         "xtl": xtl, "ytl": ytl, "xbr": xbr, "ybr": ybr, "rust": 1})
+    out_dir = tmp_path / "patches"
+
+    def run():
+        return extract_all(pd.DataFrame(rows), str(img_folder), str(out_dir), NoRotations(), workers=1)
+    run.img_folder, run.out_dir = img_folder, out_dir
+    return run
+
+
+def outputs(out_dir):
+    """Every file written, with its mtime"""
+    return {os.path.join(root, name): os.stat(os.path.join(root, name)).st_mtime_ns
+            for root, _, names in os.walk(out_dir) for name in names if name != MANIFEST_NAME}
+
+
+def test_rerun_skips_unchanged_patches(job):
+    first = job()
+    assert (first["patches"], first["skipped"], first["errors"]) == (6, 0, 0)
+    written = outputs(job.out_dir)
+    assert len(written) == 6 + 2  # patches plus a copy of each base image
+
+    second = job()
+    assert (second["patches"], second["identical"], second["skipped"]) == (0, 0, 6)
+    assert outputs(job.out_dir) == written
+
+    # Touched but identical: re-hashed, nothing rewritten
+    os.utime(job.img_folder / f"{BASES[0]}.jpg", ns=(1, 1))
+    third = job()
+    assert (third["patches"], third["identical"], third["skipped"]) == (0, 0, 6)
+    assert outputs(job.out_dir) == written
+
+    # New content: only that base's patches are redone
+    Image.new("RGB", (64, 48), "red").save(job.img_folder / f"{BASES[1]}.jpg")
+    fourth = job()
+    assert (fourth["patches"], fourth["skipped"]) == (3, 3)
+
+
+def test_interrupted_run_resumes_after_the_last_finished_base(job):
+    job()
+    manifest_path = job.out_dir / MANIFEST_NAME
+    with open(manifest_path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    # As if the run stopped while the second base was being written: its lines
+    # never made it (the last one only half) and its folder is incomplete
+    finished = [r for r in records if BASES[1] not in r.get("output", r.get("source"))]
+    torn = json.dumps(next(r for r in records if BASES[1] in r.get("output", r.get("source"))))
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        f.write("".join(json.dumps(r) + "\n" for r in finished) + torn[:len(torn) // 2])
+    second_folder = job.out_dir / BASES[1]
+    os.remove(next(p for p in second_folder.iterdir() if p.name != f"{BASES[1]}.jpg"))
+    untouched = {path: mtime for path, mtime in outputs(job.out_dir).items() if BASES[0] in path}
+
+    resumed = job()
+    assert (resumed["skipped"], resumed["patches"] + resumed["identical"], resumed["errors"]) == (3, 3, 0)
+    assert resumed["patches"] == 1  # only the missing file is written again
+    assert {path: mtime for path, mtime in outputs(job.out_dir).items() if BASES[0] in path} == untouched
+    assert len(outputs(job.out_dir)) == 8
+
+    # The repaired manifest covers everything
+    assert job()["skipped"] == 6
@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import threading
+import subprocess
+import pandas as pd
+import pytest
+from file_lock import LockHeldError
+from label_store import LabelStore
+
+TOOL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATCH = "fieldA_20230912_00001_0_0_10_10.jpg"
+OTHERS = ["fieldA_20230912_00001_10_0_20_10.jpg", "fieldB_20240302_00003_0_0_10_10.jpg"]
+
+
+def run_tool(code, *args):
+    return subprocess.run([sys.executable, "-c", code, *args], cwd=TOOL_DIR, capture_output=True, text=True)
+
+
+def test_edits_survive_a_crash_before_compaction(labels_csv):
+    before = pd.read_csv(labels_csv)
+    result = run_tool(
+        "import os, sys\n"
+        "from label_store import LabelStore\n"
+        "store = LabelStore(sys.argv[1])\n"
+        f"store.set_values({PATCH!r}, {{'rust': 0, 'Signed': 1}})\n"
+        f"store.set_values_many({OTHERS!r}, {{'blight': 1}})\n"
+        "os._exit(1)  # crash: no close(), no compaction\n", labels_csv)
+    assert result.returncode == 1, result.stderr
+    pd.testing.assert_frame_equal(pd.read_csv(labels_csv), before)
+
+    store = LabelStore(labels_csv)
+    try:
+        assert store.value(PATCH, "rust") == 0
+        assert store.value(PATCH, "Signed") == 1
+        assert all(store.value(name, "blight") == 1 for name in OTHERS)
+        expected = store.df.copy()
+    finally:
+        store.close()
+    pd.testing.assert_frame_equal(pd.read_csv(labels_csv), expected, check_dtype=False)
+    assert os.path.getsize(labels_csv + ".journal") == 0
+
+
+def test_crash_in_the_middle_of_a_compaction_is_replayed(labels_csv):
+    store = LabelStore(labels_csv)
+    store.set_values(PATCH, {"blight": 1})
+    store.journal.begin_compaction()  # journal moved aside, CSV not rewritten yet
+    store.set_values(OTHERS[0], {"rust": 1})
+    store.journal.close()  # the process dies here
+
+    assert os.path.exists(labels_csv + ".journal.compacting")
+    reopened = LabelStore(labels_csv)
+    try:
+        assert reopened.value(PATCH, "blight") == 1
+        assert reopened.value(OTHERS[0], "rust") == 1
+    finally:
+        reopened.close()
+    assert not os.path.exists(labels_csv + ".journal.compacting")
+    on_disk = pd.read_csv(labels_csv).set_index("Image Name")
+    assert on_disk.loc[PATCH, "blight"] == 1 and on_disk.loc[OTHERS[0], "rust"] == 1
+
+
+def test_compaction_while_edits_arrive_loses_nothing(labels_csv):
+    store = LabelStore(labels_csv)
+    names = store.image_names()
+    done = threading.Event()
+
+    def edit():
+        for i in range(300):
+            store.set_values(names[i % len(names)], {"rust": i % 2, "blight": (i // 2) % 2})
+        done.set()
+
+    editor = threading.Thread(target=edit)
+    editor.start()
+    while not done.is_set():
+        store.compact()
+    editor.join()
+    expected = store.df.copy()
+    store.close()
+
+    pd.testing.assert_frame_equal(pd.read_csv(labels_csv), expected, check_dtype=False)
+    reopened = LabelStore(labels_csv)
+    try:
+        pd.testing.assert_frame_equal(reopened.df, expected, check_dtype=False)
+    finally:
+        reopened.close()
+
+
+def test_a_second_writer_is_refused_or_waits(labels_csv):
+    store = LabelStore(labels_csv)
+    try:
+        with pytest.raises(LockHeldError):
+            LabelStore(labels_csv)
+        start = time.monotonic()
+        with pytest.raises(LockHeldError):
+            LabelStore(labels_csv, lock_timeout=0.3)
+        assert time.monotonic() - start >= 0.3
+
+        # Batch tools fail instead of compacting under the labelling tool
+        result = subprocess.run([sys.executable, "label_journal.py", labels_csv], cwd=TOOL_DIR,
+                                capture_output=True, text=True)
+        assert result.returncode == 1
+        assert "being edited by another process" in result.stdout
+    finally:
+        threading.Timer(0.2, store.close).start()
+    waiter = LabelStore(labels_csv, lock_timeout=5)
+    waiter.close()
+
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+import label_stats
+from label_stats import LabelStats, GROUP_KINDS
+from label_store import LabelStore
+
+
+def recomputed(df, label_columns):
+    """Stats built from the current table in one pass, the reference for update()"""
+    stats = LabelStats(label_columns)
+    stats.add_frame(df)
+    return stats
+
+
+def assert_same_stats(stats, expected):
+    assert stats.label_columns == expected.label_columns
+    assert (stats.rows, stats.signed_rows) == (expected.rows, expected.signed_rows)
+    np.testing.assert_array_equal(stats.counts, expected.counts)
+    np.testing.assert_array_equal(stats.signed_counts, expected.signed_counts)
+    np.testing.assert_array_equal(stats.cooccurrence, expected.cooccurrence)
+    for kind in GROUP_KINDS:
+        pd.testing.assert_frame_equal(stats.group_frame(kind), expected.group_frame(kind), check_dtype=False)
+
+
+def edit(store, round_):
+    names = store.image_names()
+    for i, name in enumerate(names):
+        store.set_values(name, {"rust": (i + round_) % 2, "Signed": (i * round_) % 2})
+    store.set_values_many(names[round_ % len(names):], {"blight": round_ % 2})
+
+
+@pytest.mark.parametrize("update_before_compaction", [True, False])
+def test_update_after_compaction_equals_a_full_recompute(labels_csv, capsys, update_before_compaction):
+    label_stats.update(labels_csv)
+    store = LabelStore(labels_csv)
+    try:
+        edit(store, 1)
+        if update_before_compaction:
+            label_stats.update(labels_csv)
+        store.compact()
+        edit(store, 2)
+        capsys.readouterr()
+
+        stats = label_stats.update(labels_csv)
+        out = capsys.readouterr().out
+        assert "computing from scratch" not in out
+        assert_same_stats(stats, recomputed(store.df, stats.label_columns))
+        # Saved state round-trips and a second update has nothing left to apply
+        assert_same_stats(LabelStats.load(label_stats.state_path_for(labels_csv)), stats)
+        assert_same_stats(label_stats.update(labels_csv), stats)
+        assert "Applied 0 journal entries" in capsys.readouterr().out
+    finally:
+        store.close()
+    assert_same_stats(label_stats.update(labels_csv), label_stats.compute(labels_csv))
+
+
+def test_stale_stats_are_recomputed(labels_csv, capsys):
+    label_stats.update(labels_csv)
+    pd.read_csv(labels_csv).assign(rust=1).to_csv(labels_csv, index=False)
+    capsys.readouterr()
+    stats = label_stats.update(labels_csv)
+    assert "computing from scratch" in capsys.readouterr().out
+    assert_same_stats(stats, label_stats.compute(labels_csv))
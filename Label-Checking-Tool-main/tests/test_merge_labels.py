@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+from merge_labels import LabelMerger
+
+
+def frame(rows, columns=("rust", "blight"), signed=True):
+    """rows: (name, signed, rust, blight)"""
+    df = pd.DataFrame({
+        "Image Name": [row[0] for row in rows],
+        "Signed": [row[1] for row in rows],
+        "xtl": 0, "ytl": 0, "xbr": 10, "ybr": 10,
+    })
+    for i, col in enumerate(columns):
+        df[col] = [row[2 + i] for row in rows]
+    return df if signed else df.drop(columns="Signed")
+
+
+BASE = frame([("a.jpg", 0, 1, 0), ("b.jpg", 1, 1, 0), ("c.jpg", 1, 0, 1), ("d.jpg", 0, 0, 0)])
+OTHER = frame([("a.jpg", 1, 0, 1), ("b.jpg", 1, 0, 1), ("c.jpg", 0, 1, 1), ("e.jpg", 1, 1, 1)])
+
+
+def merge(policy, other=OTHER, base_mtime=0.0, other_mtime=1.0, **kwargs):
+    merger = LabelMerger(BASE, policy, base_mtime=base_mtime, **kwargs)
+    merger.merge_chunk(other, other_mtime, np.zeros(len(BASE), dtype=bool), source="other.csv")
+    return merger, merger.result().set_index("Image Name")
+
+
+def values(result, name):
+    row = result.loc[name]
+    return int(row["Signed"]), int(row["rust"]), int(row["blight"])
+
+
+def test_signed_wins_takes_signed_rows_and_reports_signed_conflicts():
+    merger, result = merge("signed-wins")
+    assert values(result, "a.jpg") == (1, 0, 1)  # ours unsigned, theirs signed: taken
+    assert values(result, "b.jpg") == (1, 1, 0)  # both signed and different: ours kept
+    assert values(result, "c.jpg") == (1, 0, 1)  # theirs unsigned: ours kept
+    assert values(result, "d.jpg") == (0, 0, 0)  # not in the other file
+    assert "e.jpg" not in result.index
+    report = merger.conflict_report()
+    assert report["Image Name"].tolist() == ["b.jpg"]
+    assert report["Differences"].tolist() == ["rust:1->0;blight:0->1"]
+    assert report["Resolution"].tolist() == ["kept base (both signed)"]
+    assert merger.stats == {"matched": 3, "updated": 1, "conflicts": 1, "only_in_other": 1}
+
+
+@pytest.mark.parametrize("other_mtime, expected_a, resolution", [
+    (10.0, (1, 0, 1), "took newer file"),
+    (-10.0, (0, 1, 0), "kept newer base"),
+])
+def test_newest_wins_follows_file_mtimes(other_mtime, expected_a, resolution):
+    merger, result = merge("newest-wins", other_mtime=other_mtime)
+    assert values(result, "a.jpg") == expected_a
+    report = merger.conflict_report()
+    assert report["Image Name"].tolist() == ["a.jpg", "b.jpg", "c.jpg"]
+    assert set(report["Resolution"]) == {resolution}
+
+
+def test_union_and_intersection_combine_labels_and_signed():
+    _, union = merge("union")
+    assert [values(union, name) for name in ("a.jpg", "b.jpg", "c.jpg")] == [(1, 1, 1), (1, 1, 1), (1, 1, 1)]
+    _, intersection = merge("intersection")
+    assert [values(intersection, name) for name in ("a.jpg", "b.jpg", "c.jpg")] == [(0, 0, 0), (1, 0, 0), (0, 0, 1)]
+
+
+def test_add_new_appends_rows_only_in_the_other_file():
+    _, result = merge("signed-wins", add_new=True)
+    assert values(result, "e.jpg") == (1, 1, 1)
+    assert list(result.index) == ["a.jpg", "b.jpg", "c.jpg", "d.jpg", "e.jpg"]
+
+
+@pytest.mark.parametrize("policy", ["signed-wins", "newest-wins", "union", "intersection"])
+def test_missing_signed_column_leaves_signed_alone(policy, capsys):
+    merger, result = merge(policy, other=frame([("b.jpg", 0, 0, 1), ("c.jpg", 0, 1, 1)], signed=False))
+    assert result["Signed"].tolist() == BASE["Signed"].tolist()
+    assert "has no Signed column" in capsys.readouterr().out
+
+
+def test_other_file_without_a_label_column_keeps_ours():
+    other = frame([("a.jpg", 1, 0)], columns=("rust",))
+    _, result = merge("signed-wins", other=other)
+    assert values(result, "a.jpg") == (1, 0, 0)
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        LabelMerger(BASE, "coin-flip")
@@ -0,0 +1,153 @@
+import io
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from PIL import Image
+
+
+CACHE_PATH = "thumbnails.sqlite"
+THUMB_SIZE = (144, 144)  # ImageGrid button minus its 3px border
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+TOUCH_BATCH = 256  # last_used updates written together
+TOUCH_FLUSH_SECONDS = 5.0
+
+
+class ThumbnailCache:
+    """Pre-scaled thumbnails in a single sqlite blob store, evicted LRU.
+
+    Entries are keyed by path + mtime + file size + thumbnail size, so an
+    edited or replaced patch simply misses and is re-decoded once. Hits only
+    note their access time in memory; the last_used updates are written in
+    one transaction per batch (or every few seconds), not one per hit.
+    """
+
+    def __init__(self, db_path=CACHE_PATH, max_bytes=MAX_CACHE_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._local = threading.local()  # sqlite connections are per thread
+        self._evict_lock = threading.Lock()
+        self._touch_lock = threading.Lock()
+        self._touched = {}  # key -> last access time not yet written
+        self._last_flush = time.monotonic()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS thumbs (
+                key TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                bytes INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS thumbs_lru ON thumbs (last_used)")
+        conn.commit()
+        self._total_bytes = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM thumbs").fetchone()[0]
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key_for(img_path, size=THUMB_SIZE):
+        stat = os.stat(img_path)
+        raw = f"{os.path.abspath(img_path)}|{stat.st_mtime_ns}|{stat.st_size}|{size[0]}x{size[1]}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """(jpeg_bytes, width, height) or None"""
+        conn = self._conn()
+        row = conn.execute("SELECT data, width, height FROM thumbs WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with self._touch_lock:
+            self._touched[key] = time.time()
+            due = (len(self._touched) >= TOUCH_BATCH
+                   or time.monotonic() - self._last_flush >= TOUCH_FLUSH_SECONDS)
+        if due:
+            self.flush_access_times()
+        return bytes(row[0]), row[1], row[2]
+
+    def flush_access_times(self):
+        """Write the access times noted by get() in a single transaction"""
+        with self._touch_lock:
+            touched, self._touched = self._touched, {}
+            self._last_flush = time.monotonic()
+        if not touched:
+            return
+        conn = self._conn()
+        conn.executemany("UPDATE thumbs SET last_used = ? WHERE key = ?",
+                         [(used, key) for key, used in touched.items()])
+        conn.commit()
+
+    def put(self, key, data, width, height):
+        conn = self._conn()
+        with self._evict_lock:
+            # A replaced row gives its old size back
+            old = conn.execute("SELECT bytes FROM thumbs WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO thumbs (key, data, width, height, bytes, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(data), width, height, len(data), time.time()))
+            conn.commit()
+            self._total_bytes += len(data) - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict(conn)
+
+    def _evict(self, conn):
+        """Drop least recently used thumbnails until the store is under 90% of max_bytes"""
+        self.flush_access_times()  # LRU order needs the recent hits
+        target = self.max_bytes * 0.9
+        doomed = []
+        for key, size in conn.execute("SELECT key, bytes FROM thumbs ORDER BY last_used"):
+            if self._total_bytes <= target:
+                break
+            doomed.append((key,))
+            self._total_bytes -= size
+        conn.executemany("DELETE FROM thumbs WHERE key = ?", doomed)
+        conn.commit()
+
+    def thumbnail(self, img_path, size=THUMB_SIZE):
+        """Cached thumbnail for img_path; decodes and stores it on a miss"""
+        key = self.key_for(img_path, size)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        data, width, height = make_thumbnail(img_path, size)
+        self.put(key, data, width, height)
+        return data, width, height
+
+    def close(self):
+        self.flush_access_times()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def make_thumbnail(img_path, size=THUMB_SIZE):
+    """Decode once and scale to fit `size`, keeping the aspect ratio"""
+    with Image.open(img_path) as img:
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale; keep 2x headroom for LANCZOS
+        img.draft("RGB", (size[0] * 2, size[1] * 2))
+        img = img.convert("RGB")
+        img.thumbnail(size, Image.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=90)
+        return buffer.getvalue(), img.width, img.height
+
+
+_shared_cache = None
+
+
+def get_thumbnail_cache(db_path=CACHE_PATH):
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = ThumbnailCache(db_path)
+    return _shared_cache